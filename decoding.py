@@ -0,0 +1,245 @@
+"""Разбор JSON-ответов API Практикум Домашка."""
+import codecs
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from metrics import METRICS
+from records import homework_key
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 64 * 1024))
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'orjson' if orjson else 'json')
+JSON_PROCESSES = int(os.getenv('JSON_PROCESSES', 0))
+JSON_OFFLOAD_SIZE = int(os.getenv('JSON_OFFLOAD_SIZE', 1024 * 1024))
+
+WHITESPACE = ' \t\n\r'
+CURRENT_DATE = re.compile(rb'"current_date"\s*:\s*(-?\d+)')
+UNEXPECTED_END_PHRASE = 'Ответ API оборвался'
+EXPECTED_PHRASE = 'Ожидался один из символов {chars!r}'
+
+
+def loads(body):
+    """Разбор JSON из байтов выбранной библиотекой.
+
+    orjson используется, если установлен и не отключён
+    через JSON_BACKEND=json.
+    """
+    if JSON_BACKEND == 'orjson' and orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+_pool = None
+
+
+def pool():
+    """Пул процессов для разбора больших ответов, создаётся по требованию."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=JSON_PROCESSES)
+    return _pool
+
+
+def decode(body):
+    """Разбор тела ответа; большое тело разбирается в пуле процессов.
+
+    Разбор в отдельном процессе не держит GIL, поэтому цикл событий
+    и остальные потоки опроса не ждут его завершения.
+    """
+    start = time.monotonic()
+    try:
+        if JSON_PROCESSES and len(body) >= JSON_OFFLOAD_SIZE:
+            METRICS.inc('json.offloaded')
+            return pool().submit(loads, body).result()
+        return loads(body)
+    finally:
+        METRICS.observe('json.decode', time.monotonic() - start)
+
+
+class JsonStream:
+    """Буфер над потоком байтов для пошагового разбора JSON.
+
+    В буфере хранится только ещё не разобранный хвост,
+    поэтому его размер ограничен куском потока и одним значением.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        """Подгрузка следующего куска; False, если поток закончился."""
+        for chunk in self.chunks:
+            self.buffer = self.buffer[self.pos:] + self.text.decode(chunk)
+            self.pos = 0
+            return True
+        return False
+
+    def fail(self, message):
+        """Ошибка разбора в текущей позиции."""
+        raise json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def peek(self):
+        """Первый значащий символ после пробелов."""
+        while True:
+            while (
+                self.pos < len(self.buffer)
+                and self.buffer[self.pos] in WHITESPACE
+            ):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                self.fail(UNEXPECTED_END_PHRASE)
+
+    def expect(self, chars):
+        """Пропуск одного из символов chars, возвращает его."""
+        char = self.peek()
+        if char not in chars:
+            self.fail(EXPECTED_PHRASE.format(chars=chars))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Очередное значение JSON целиком.
+
+        Значение, упёршееся в конец буфера, может быть обрезанным
+        числом, поэтому оно разбирается заново после подгрузки.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Элементы массива JSON по одному."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def newest(homeworks):
+    """Последняя запись каждой работы в порядке первого появления."""
+    records = {}
+    for homework in homeworks:
+        if not isinstance(homework, dict):
+            records[len(records), None] = homework
+            continue
+        key = homework_key(homework)
+        known = records.get(key)
+        if known is None or (
+            homework.get('date_updated', '') >= known.get('date_updated', '')
+        ):
+            records[key] = homework
+    return list(records.values())
+
+
+def parse_stream(chunks):
+    """Разбор ответа API по частям.
+
+    Записи homeworks разбираются по одной, и для каждой работы
+    остаётся только самая свежая, поэтому память не растёт
+    с длиной истории.
+    """
+    stream = JsonStream(chunks)
+    data = {}
+    stream.expect('{')
+    if stream.peek() == '}':
+        return data
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        if key == 'homeworks' and stream.peek() == '[':
+            data[key] = newest(stream.array())
+        else:
+            data[key] = stream.value()
+        if stream.expect(',}') == '}':
+            return data
+
+
+def release(response):
+    """Возврат соединения ответа, запрошенного потоком, в пул."""
+    close = getattr(response, 'close', None)
+    if close is not None:
+        close()
+
+
+def decode_response(response, stream=False):
+    """Тело ответа API.
+
+    Ответ, запрошенный потоком (stream=True), разбирается по частям,
+    остальные — целиком через decode(); объекты без тела в байтах
+    разбирают себя сами через json().
+    """
+    if not stream or not hasattr(response, 'iter_content'):
+        body = getattr(response, 'content', None)
+        if not isinstance(body, bytes):
+            return response.json()
+        return decode(body)
+    try:
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        data = parse_stream(chunks)
+        for _ in chunks:
+            pass
+        return data
+    finally:
+        release(response)
+
+
+@dataclass(frozen=True)
+class Validators:
+    """Признаки тела ответа API для повторного запроса.
+
+    digest — хеш тела без current_date, который меняется в каждом
+    ответе; по нему сравниваются ответы. etag отправляется
+    в If-None-Match, если сервер его выдал.
+    """
+
+    digest: str
+    etag: Optional[str] = field(default=None, compare=False)
+
+
+def body_validators(response):
+    """Признаки тела ответа, либо None, если тела в байтах нет."""
+    body = getattr(response, 'content', None)
+    if not isinstance(body, bytes):
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    return Validators(
+        hashlib.blake2b(
+            CURRENT_DATE.sub(b'', body), digest_size=16
+        ).hexdigest(),
+        headers.get('ETag')
+    )
+
+
+def current_date(response):
+    """Ответ из одного current_date, найденного в теле без разбора JSON."""
+    match = CURRENT_DATE.search(getattr(response, 'content', None) or b'')
+    return {'current_date': int(match[1])} if match else {}
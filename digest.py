@@ -0,0 +1,68 @@
+"""Учёт ошибок по отпечаткам и сводки вместо потока сообщений."""
+import os
+import time
+
+ERROR_WINDOW = int(os.getenv('ERROR_WINDOW', 3600))
+
+ERROR_DIGEST_PHRASE = 'Сводка ошибок за {window} с:\n{lines}'
+DIGEST_LINE_PHRASE = '{message} — повторилась {count} раз(а).'
+
+
+def fingerprint(error):
+    """Отпечаток ошибки: класс и стабильные поля, без текста сообщения.
+
+    Текст часто содержит изменчивые детали (адреса, параметры запроса),
+    поэтому учитываются только класс исключения, код ответа API
+    и класс исходной ошибки.
+    """
+    parts = [type(error).__name__]
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        parts.append(str(int(status_code)))
+    cause = error.__cause__ or error.__context__
+    if cause is not None:
+        parts.append(type(cause).__name__)
+    return ':'.join(parts)
+
+
+class ErrorDigest:
+    """Ограничение сообщений об ошибках по отпечатку.
+
+    Об ошибке с новым отпечатком сообщается сразу; повторы в течение
+    window секунд только считаются и раз в window секунд собираются
+    в одну сводку.
+    """
+
+    def __init__(self, window=ERROR_WINDOW, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.reported = {}
+        self.suppressed = {}
+        self.summarized = clock()
+
+    def add(self, error, message):
+        """Учёт ошибки: сообщение для отправки сразу, либо None."""
+        key = fingerprint(error)
+        now = self.clock()
+        reported = self.reported.get(key)
+        if reported is None or now - reported >= self.window:
+            self.reported[key] = now
+            return message
+        count, _ = self.suppressed.get(key, (0, message))
+        self.suppressed[key] = (count + 1, message)
+        return None
+
+    def summary(self):
+        """Сводка подавленных повторов, если окно истекло, иначе None."""
+        now = self.clock()
+        if now - self.summarized < self.window:
+            return None
+        self.summarized = now
+        if not self.suppressed:
+            return None
+        lines = '\n'.join(
+            DIGEST_LINE_PHRASE.format(message=message, count=count)
+            for count, message in self.suppressed.values()
+        )
+        self.suppressed.clear()
+        return ERROR_DIGEST_PHRASE.format(window=self.window, lines=lines)
@@ -0,0 +1,458 @@
+"""Асинхронный движок опроса API Практикум Домашка."""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from telebot import TeleBot
+
+from exceptions import ApiRateLimitError, DeadlineExceededError
+from heartbeat import WATCHDOG
+from homework import (
+    CONNECT_TIMEOUT, ERROR_PHRASE, NO_HOMEWORKS_PHRASE, READ_TIMEOUT,
+    RETRY_PERIOD, TELEGRAM_TOKEN,
+    check_response, next_cursor, parse_status, request_if_changed
+)
+from metrics import METRICS, PhaseHistogram
+from outbox import LANE_ERROR, Notification, Outbox, status_lane
+from resilience import CircuitBreaker, RateBudget, SingleFlight, is_outage
+from scheduler import TimingWheel, jittered, next_interval, poll_phase
+from storage import StateStore
+from subscriptions import load_subscriptions
+from tracker import HomeworkIndex
+from transport import PooledTransport, telegram_transport
+
+POLL_WORKERS = int(os.getenv('POLL_WORKERS', 32))
+METRICS_PERIOD = int(os.getenv('METRICS_PERIOD', 60))
+WHEEL_TICK = float(os.getenv('WHEEL_TICK', 1))
+POLL_DEADLINE = float(
+    os.getenv('POLL_DEADLINE', CONNECT_TIMEOUT + READ_TIMEOUT + 10)
+)
+
+ENGINE_STARTED_PHRASE = 'Движок опроса запущен, подписок: {count}.'
+METRICS_PHRASE = 'Метрики: {metrics}'
+GLOBAL_BREAKER_PHRASE = (
+    'API Практикума недоступно, опросы приостановлены до {retry_at:.0f}.'
+)
+THROTTLED_PHRASE = (
+    'API Практикума ограничило частоту запросов, Retry-After: {retry_after}.'
+)
+DEADLINE_PHRASE = 'Опрос не уложился в {deadline} с и прерван.'
+PHASE_HISTOGRAM_PHRASE = 'Запросы к API по фазе периода:\n{histogram}'
+
+
+class PollingEngine:
+    """Опрос API в цикле событий asyncio без блокирующих вызовов.
+
+    bot — бот или список ботов: первый основной, остальные пишут
+    в чаты подписок, за которыми закреплены (Subscription.bot).
+    """
+
+    def __init__(
+            self, bot, http_get=requests.get, store=None, outbox=None,
+            workers=POLL_WORKERS
+    ):
+        self.http_get = http_get
+        self.store = store or StateStore()
+        self.outbox = outbox or Outbox(bot, store=self.store)
+        self.workers = workers
+        self.phases = PhaseHistogram(RETRY_PERIOD)
+        self.breaker = CircuitBreaker()
+        self.budget = RateBudget()
+        self.flights = SingleFlight()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='poll'
+        )
+
+    async def call(self, func, *args):
+        """Выполнение блокирующей функции в пуле потоков."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(func, *args)
+        )
+
+    async def get_api_answer(self, subscription, name='poll'):
+        """Ответ API и признаки его тела для подписки.
+
+        Подписки разных чатов с одним токеном и одинаковыми признаками
+        прошлого ответа делят один запрос. name — обработчик, которого
+        сторож считает занятым, пока запрос выполняется.
+        """
+        return await self.flights.do(
+            (subscription.key, subscription.validators),
+            subscription.timestamp,
+            partial(
+                self.fetch, subscription.headers, subscription.timestamp,
+                subscription.validators, name
+            )
+        )
+
+    async def fetch(self, headers, timestamp, validators, name='poll'):
+        """Запрос к API в пределах общего лимита частоты.
+
+        Сам запрос ограничен сроком POLL_DEADLINE: зависший запрос
+        прерывается и учитывается как сбой API. Ожидание лимита
+        и отправка сообщений в срок не входят, и сторож не считает
+        обработчик name занятым на время этих пауз.
+        """
+        if await self.budget.acquire():
+            METRICS.inc('budget.deferred')
+        self.phases.record(time.time())
+        WATCHDOG.busy(name)
+        try:
+            return await asyncio.wait_for(self.call(
+                request_if_changed, self.http_get, headers, timestamp,
+                validators
+            ), POLL_DEADLINE)
+        except asyncio.TimeoutError as error:
+            METRICS.inc('deadline.missed')
+            raise DeadlineExceededError(
+                DEADLINE_PHRASE.format(deadline=POLL_DEADLINE)
+            ) from error
+        finally:
+            WATCHDOG.idle(name)
+
+    def delivered(
+            self, subscription, homework, pending, cursor, validators, text
+    ):
+        """Фиксация статуса работы после доставки сообщения о нём."""
+        subscription.sent_message = text
+        self.settle(subscription, homework, pending, cursor, validators)
+
+    def settle(self, subscription, homework, pending, cursor, validators):
+        """Фиксация статуса работы, сообщение о котором обработано.
+
+        Сообщение доставлено либо отброшено очередью без надежды
+        на доставку. pending — ключи ещё не обработанных работ того же ответа:
+        когда обработана последняя, курсор сдвигается до cursor,
+        а признаки ответа запоминаются как обработанные.
+        """
+        self.store.save_status(
+            subscription.key,
+            subscription.chat_id,
+            subscription.index.commit(homework),
+            homework.status
+        )
+        pending.discard(homework.key)
+        if not pending:
+            subscription.timestamp = max(subscription.timestamp, cursor)
+            subscription.validators = validators
+
+    async def poll_once(self, subscription, name='poll'):
+        """Один цикл опроса подписки, аналог тела цикла homework.main.
+
+        Возвращает True, если в ответе были изменения статусов,
+        и None, если опрос отложен лимитом частоты. Курсор сдвигается
+        сразу, если изменений нет, иначе — после доставки всех
+        сообщений об изменениях ответа. Ответ, совпавший с последним
+        обработанным, не разбирается и не проверяется.
+        """
+        try:
+            response, validators = await self.get_api_answer(
+                subscription, name
+            )
+            self.budget.success()
+            self.breaker.success()
+            subscription.breaker.success()
+            cursor = next_cursor(response, subscription.timestamp)
+            if validators is not None and (
+                validators == subscription.validators
+            ):
+                METRICS.inc('cache.hit')
+                WATCHDOG.beat('poll')
+                subscription.timestamp = cursor
+                return False
+            METRICS.inc('cache.miss')
+            homeworks = check_response(response)
+            WATCHDOG.beat('poll')
+            if not homeworks:
+                logging.debug(NO_HOMEWORKS_PHRASE)
+                subscription.timestamp = cursor
+                subscription.validators = validators
+                return False
+            subscription.status = homeworks[0].status or ''
+            for homework in subscription.index.seed(homeworks):
+                self.store.save_status(
+                    subscription.key, subscription.chat_id,
+                    homework.key, homework.status
+                )
+            changed = subscription.index.diff(homeworks)
+            if not changed:
+                subscription.timestamp = cursor
+                subscription.validators = validators
+            pending = {homework.key for homework in changed}
+            for homework in changed:
+                await self.outbox.put(Notification(
+                    subscription.chat_id,
+                    parse_status(homework),
+                    key=homework.key,
+                    priority=status_lane(homework.status),
+                    on_delivered=partial(
+                        self.delivered, subscription, homework,
+                        pending, cursor, validators
+                    ),
+                    on_dropped=partial(
+                        self.settle, subscription, homework,
+                        pending, cursor, validators
+                    )
+                ))
+            return bool(changed)
+        except Exception as error:
+            return await self.report_error(subscription, error)
+
+    async def report_error(self, subscription, error):
+        """Учёт ошибки лимитом частоты и размыкателями цепи.
+
+        Ответ 429 не считается ошибкой: лимит частоты снижается, опрос
+        откладывается (возвращается None), а пробный запрос размыкателей
+        переносится на время после Retry-After. Сбои API и сети размыкают
+        общую цепь и в чаты не отправляются, остальные ошибки размыкают
+        цепь подписки; в чат сообщается только о размыкании, и то
+        не чаще раза в окно отпечатка ошибки (повторы идут в сводку).
+        """
+        if isinstance(error, ApiRateLimitError):
+            METRICS.inc('budget.throttled')
+            self.budget.throttle(error.retry_after)
+            self.breaker.hold(error.retry_after)
+            subscription.breaker.hold(error.retry_after)
+            logging.warning(THROTTLED_PHRASE.format(
+                retry_after=error.retry_after
+            ))
+            return None
+        message = ERROR_PHRASE.format(error=error)
+        logging.error(message)
+        if is_outage(error):
+            if self.breaker.failure():
+                METRICS.inc('breaker.global_opened')
+                logging.warning(GLOBAL_BREAKER_PHRASE.format(
+                    retry_at=self.breaker.retry_at
+                ))
+            return False
+        self.breaker.success()
+        if not subscription.breaker.failure():
+            return False
+        METRICS.inc('breaker.opened')
+        message = subscription.errors.add(error, message)
+        if message is None:
+            METRICS.inc('errors.suppressed')
+        elif message != subscription.sent_message:
+            subscription.sent_message = message
+            await self.outbox.put(Notification(
+                subscription.chat_id, message, priority=LANE_ERROR
+            ))
+        return False
+
+    async def report_digest(self, subscription):
+        """Отправка сводки подавленных ошибок подписки, если она готова."""
+        summary = subscription.errors.summary()
+        if summary:
+            await self.outbox.put(Notification(
+                subscription.chat_id, summary, priority=LANE_ERROR
+            ))
+
+    def deferral(self, subscription):
+        """Момент, до которого опрос отложен размыкателями, либо None.
+
+        allow() переводит разомкнутую цепь в пробу, поэтому сначала
+        проверяется цепь подписки, а если запрос не пропускает общая,
+        проба подписки возвращается обратно через hold(0).
+        """
+        if not subscription.breaker.allow():
+            return subscription.breaker.retry_at
+        if not self.breaker.allow():
+            subscription.breaker.hold(0)
+            return self.breaker.retry_at
+        return None
+
+    def restore(self, subscription):
+        """Восстановление курсора, сообщения и статусов из хранилища."""
+        subscription.timestamp, subscription.sent_message = (
+            self.store.load_state(subscription.key, subscription.chat_id)
+        )
+        subscription.index = HomeworkIndex(
+            self.store.load_statuses(subscription.key, subscription.chat_id)
+        )
+
+    def persist(self, subscription):
+        """Сохранение состояния подписки в хранилище."""
+        self.store.save_state(
+            subscription.key,
+            subscription.chat_id,
+            subscription.timestamp,
+            subscription.sent_message
+        )
+
+    def schedule(self, subscriptions, due):
+        """Постановка чатов одного токена в колесо таймеров на момент due.
+
+        Чаты токена стоят в колесе одной записью и опрашиваются вместе,
+        поэтому делят один запрос к API.
+        """
+        for subscription in subscriptions:
+            subscription.due = due
+        self.wheel.schedule(subscriptions, due)
+
+    async def dispatch(self):
+        """Передача токенов, срок опроса которых наступил, обработчикам."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for subscriptions, _ in self.wheel.advance(loop.time()):
+                self.due_queue.put_nowait(subscriptions)
+            METRICS.gauge('scheduler.queue', self.due_queue.qsize())
+            METRICS.gauge('scheduler.scheduled', self.wheel.size)
+
+    async def poll_worker(self, name='poll'):
+        """Обработчик: берёт чаты токена из очереди и опрашивает их.
+
+        Если сторож отменит зависший опрос, чаты возвращаются
+        в расписание, а не теряются, и пробный запрос размыкателей
+        разрешается снова.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            subscriptions = await self.due_queue.get()
+            try:
+                await self.process(subscriptions, name)
+            except asyncio.CancelledError:
+                self.breaker.hold(0)
+                for subscription in subscriptions:
+                    subscription.breaker.hold(0)
+                self.schedule(subscriptions, loop.time())
+                raise
+
+    async def process(self, subscriptions, name='poll'):
+        """Одновременный опрос чатов одного токена и их возврат в расписание.
+
+        Следующий срок — ближайший из сроков чатов со случайным
+        отклонением, общим для всего токена, поэтому чаты остаются
+        выровненными и их опросы снова сольются в один запрос.
+        Срок отсчитывается от планового, а не от конца запроса,
+        поэтому время ответа API не сдвигает расписание.
+        """
+        loop = asyncio.get_running_loop()
+        due = subscriptions[0].due
+        METRICS.observe('scheduler.lag', loop.time() - due)
+        targets = await asyncio.gather(*(
+            self.process_chat(subscription, name)
+            for subscription in subscriptions
+        ))
+        self.schedule(subscriptions, max(
+            due + jittered(min(targets) - due), loop.time()
+        ))
+
+    async def process_chat(self, subscription, name='poll'):
+        """Опрос одного чата; возвращает желаемый срок следующего опроса.
+
+        Опрос, отложенный ответом 429, повторяется сразу после паузы
+        общего лимита частоты.
+        """
+        loop = asyncio.get_running_loop()
+        retry_at = self.deferral(subscription)
+        if retry_at is not None:
+            METRICS.inc('breaker.deferred')
+            return max(retry_at, loop.time()) + (
+                random.uniform(0, self.breaker.base_delay)
+            )
+        changed = await self.poll_once(subscription, name)
+        if changed is None:
+            return loop.time()
+        await self.report_digest(subscription)
+        self.persist(subscription)
+        subscription.interval = next_interval(
+            subscription.status, subscription.interval, changed
+        )
+        return subscription.due + subscription.interval
+
+    async def report_metrics(self):
+        """Периодическая запись метрик в лог."""
+        while True:
+            await asyncio.sleep(METRICS_PERIOD)
+            METRICS.gauge('scheduler.peak_rps', max(self.phases.rates()))
+            METRICS.gauge('breaker.global_state', self.breaker.state)
+            METRICS.gauge('budget.rate', self.budget.rate)
+            METRICS.gauge(
+                'cache.hit_ratio', METRICS.ratio('cache.hit', 'cache.miss')
+            )
+            logging.info(METRICS_PHRASE.format(metrics=json.dumps(
+                METRICS.snapshot(), ensure_ascii=False, sort_keys=True
+            )))
+            logging.debug(PHASE_HISTOGRAM_PHRASE.format(
+                histogram=self.phases.render()
+            ))
+
+    async def run(self, subscriptions):
+        """Параллельный опрос всех подписок в одном цикле событий."""
+        now = asyncio.get_running_loop().time()
+        self.wheel = TimingWheel(now, tick=WHEEL_TICK)
+        self.due_queue = asyncio.Queue()
+        tokens = {}
+        for subscription in subscriptions:
+            self.restore(subscription)
+            self.outbox.assign(subscription.chat_id, subscription.bot)
+            tokens.setdefault(subscription.key, []).append(subscription)
+        for key, chats in tokens.items():
+            self.schedule(chats, now + poll_phase(key))
+        logging.info(ENGINE_STARTED_PHRASE.format(count=len(subscriptions)))
+        WATCHDOG.start(asyncio.get_running_loop())
+        try:
+            await asyncio.gather(
+                self.report_metrics(),
+                self.dispatch(),
+                self.outbox.restore(),
+                *(
+                    WATCHDOG.supervise(f'send{index}', self.outbox.sender)
+                    for index in range(self.outbox.workers)
+                ),
+                *(
+                    WATCHDOG.supervise(f'poll{index}', self.poll_worker)
+                    for index in range(self.workers)
+                )
+            )
+        finally:
+            WATCHDOG.stop()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.outbox.close()
+            self.store.close()
+
+
+def main():
+    """Запуск асинхронного движка опроса."""
+    subscriptions = load_subscriptions()
+    transport = PooledTransport('practicum', pool_size=POLL_WORKERS)
+    telegram = telegram_transport()
+    tokens = dict.fromkeys([TELEGRAM_TOKEN, *filter(None, (
+        subscription.bot for subscription in subscriptions
+    ))])
+    engine = PollingEngine(
+        [TeleBot(token=token) for token in tokens], http_get=transport.get
+    )
+    try:
+        asyncio.run(engine.run(subscriptions))
+    finally:
+        transport.close()
+        telegram.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(
+        format=(
+            '%(asctime)s - %(levelname)s'
+            ' - %(funcName)s:%(lineno)d - %(message)s'),
+        level=logging.DEBUG,
+        handlers=[
+            logging.FileHandler(
+                os.path.abspath(__file__) + '.log',
+                mode='w',
+                encoding='utf-8'
+            ),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+    main()
@@ -1,6 +1,22 @@
 class ApiResponseError(Exception):
     """Исключение в случаи когда в ответе отличного от 200."""
 
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class ApiResponseDataError(Exception):
     """Исключение в случаи когда в ответе есть ключи-ошибки."""
+
+
+class ApiRateLimitError(ApiResponseError):
+    """Исключение в случаи когда API ограничивает частоту запросов (429)."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message, status_code)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(ConnectionError):
+    """Исключение в случаи когда цикл опроса не уложился в срок."""
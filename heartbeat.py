@@ -0,0 +1,149 @@
+"""Сторож циклов опроса и отправки: пульс, задержка и перезапуск."""
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import METRICS
+
+WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', 10))
+WATCHDOG_STALL = float(os.getenv('WATCHDOG_STALL', 120))
+
+STALLED_PHRASE = 'Обработчик {name} занят уже {seconds:.0f} с:\n{stack}'
+RESTARTED_PHRASE = 'Зависший обработчик {name} перезапущен:\n{stack}'
+LOOP_LAG_PHRASE = 'Цикл событий не отвечает {lag:.1f} с.'
+
+
+class Watchdog:
+    """Пульс обработчиков, задержка цикла событий и перезапуск зависших.
+
+    Обработчик отмечает начало и конец работы (busy / idle); если работа
+    длится дольше stall секунд, в лог пишется его стек, а задача asyncio,
+    запущенная через supervise, отменяется и запускается заново.
+    Удачные опросы и отправки отмечаются через beat, время с последней
+    отметки попадает в метрики watchdog.since_<имя>.
+    """
+
+    def __init__(
+            self, interval=WATCHDOG_INTERVAL, stall=WATCHDOG_STALL,
+            clock=time.monotonic
+    ):
+        self.interval = interval
+        self.stall = stall
+        self.clock = clock
+        self.beats = {}
+        self.started = {}
+        self.tasks = {}
+        self.restarting = set()
+        self.loop = None
+        self.ping = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def beat(self, name):
+        """Отметка удачного завершения операции name."""
+        self.beats[name] = self.clock()
+
+    def busy(self, name):
+        """Обработчик name начал работу."""
+        self.started[name] = (self.clock(), threading.get_ident())
+
+    def idle(self, name):
+        """Обработчик name закончил работу."""
+        self.started.pop(name, None)
+
+    async def supervise(self, name, factory):
+        """Запуск обработчика factory(name) с перезапуском после зависания."""
+        while True:
+            task = self.tasks[name] = asyncio.ensure_future(factory(name))
+            try:
+                return await task
+            except asyncio.CancelledError:
+                if name not in self.restarting:
+                    raise
+                self.restarting.discard(name)
+                METRICS.inc('watchdog.restarts')
+
+    def restart(self, name):
+        """Отмена зависшей задачи; supervise запустит её заново."""
+        task = self.tasks.get(name)
+        if name not in self.started or task is None or task.done():
+            return
+        stack = io.StringIO()
+        task.print_stack(file=stack)
+        logging.error(RESTARTED_PHRASE.format(
+            name=name, stack=stack.getvalue()
+        ))
+        self.started.pop(name)
+        self.restarting.add(name)
+        task.cancel()
+
+    def pong(self):
+        """Ответ цикла событий на проверку задержки."""
+        if self.ping is not None:
+            METRICS.gauge('watchdog.loop_lag', self.clock() - self.ping)
+            self.ping = None
+
+    def check_loop(self, now):
+        """Замер задержки цикла событий."""
+        if self.ping is None:
+            self.ping = now
+            try:
+                self.loop.call_soon_threadsafe(self.pong)
+            except RuntimeError:
+                self.loop = self.ping = None
+            return
+        lag = now - self.ping
+        METRICS.gauge('watchdog.loop_lag', lag)
+        if lag >= self.interval:
+            logging.warning(LOOP_LAG_PHRASE.format(lag=lag))
+
+    def check(self):
+        """Одна проверка: пульс, задержка цикла и зависшие обработчики."""
+        now = self.clock()
+        for name, last in list(self.beats.items()):
+            METRICS.gauge(f'watchdog.since_{name}', round(now - last, 3))
+        if self.loop is not None:
+            self.check_loop(now)
+        for name, (since, ident) in list(self.started.items()):
+            if now - since < self.stall:
+                continue
+            METRICS.inc('watchdog.stalled')
+            if name in self.tasks and self.loop is not None:
+                self.loop.call_soon_threadsafe(self.restart, name)
+                continue
+            frame = sys._current_frames().get(ident)
+            logging.error(STALLED_PHRASE.format(
+                name=name, seconds=now - since,
+                stack=''.join(traceback.format_stack(frame)) if frame else ''
+            ))
+            self.started[name] = (now, ident)
+
+    def watch(self):
+        """Проверки раз в interval секунд до остановки."""
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def start(self, loop=None):
+        """Запуск потока сторожа, если он ещё не запущен."""
+        self.loop = loop
+        self.ping = None
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.watch, name='watchdog', daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        """Остановка потока сторожа."""
+        self.stopped.set()
+        self.loop = None
+
+
+WATCHDOG = Watchdog()
@@ -1,3 +1,4 @@
+from email.utils import parsedate_to_datetime
 from http import HTTPStatus
 import logging
 import os
@@ -8,7 +9,17 @@ from dotenv import load_dotenv
 from telebot import TeleBot
 
 from requests.exceptions import RequestException
-from exceptions import ApiResponseError, ApiResponseDataError
+from decoding import (
+    body_validators, current_date, decode_response, release
+)
+from digest import ErrorDigest
+from exceptions import (
+    ApiRateLimitError, ApiResponseError, ApiResponseDataError
+)
+from heartbeat import WATCHDOG
+from records import Homework, HomeworkStatus
+from storage import StateStore, token_key
+from tracker import HomeworkIndex
 
 load_dotenv()
 
@@ -18,6 +29,9 @@ TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 TOKENS = ('PRACTICUM_TOKEN', 'TELEGRAM_TOKEN', 'TELEGRAM_CHAT_ID')
 
 RETRY_PERIOD = 600
+CONNECT_TIMEOUT = float(os.getenv('CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('READ_TIMEOUT', 15))
+CURSOR_OVERLAP = int(os.getenv('CURSOR_OVERLAP', 60))
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
 HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
 
@@ -64,6 +78,7 @@ NOT_FOUND_NAME_PHRASE = 'Не было найдено название рабо
 NOT_FOUND_STATUS_PHRASE = 'Не был найден статус работы'
 STATUS_ERROR_PHRASE = 'Такой статус: {status} не обрабатывается'
 NO_HOMEWORKS_PHRASE = 'Нет домашних работ.'
+REDACTED = 'OAuth ***'
 
 
 def check_tokens():
@@ -81,9 +96,15 @@ def check_tokens():
 
 def send_message(bot, message):
     """Отправка ботом сообщений."""
+    return send_to_chat(bot, TELEGRAM_CHAT_ID, message)
+
+
+def send_to_chat(bot, chat_id, message):
+    """Отправка ботом сообщения в указанный чат."""
     try:
-        bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
+        bot.send_message(chat_id=chat_id, text=message)
         logging.debug(PHRASE_SEND_MESSAGE.format(message=message))
+        WATCHDOG.beat('send')
         return True
     except Exception as error:
         logging.exception(
@@ -94,40 +115,122 @@ def send_message(bot, message):
 
 def get_api_answer(timestamp):
     """Получение ответа от сервиса Практикум Домашка по API."""
+    return request_api_answer(requests.get, HEADERS, timestamp)
+
+
+def request_api_answer(http_get, headers, timestamp):
+    """Запрос к API Практикум Домашка через переданный HTTP-клиент.
+
+    Таймауты соединения и чтения не дают зависшему соединению
+    остановить цикл опроса. Полная история (from_date=0) читается
+    потоком и разбирается по частям.
+    """
+    return request_if_changed(http_get, headers, timestamp)[0]
+
+
+def request_if_changed(http_get, headers, timestamp, validators=None):
+    """Запрос к API с учётом признаков прошлого ответа.
+
+    Возвращает пару (ответ, признаки тела). Если сервер ответил 304
+    на If-None-Match или тело совпало с validators, JSON не разбирается:
+    вместо ответа возвращается словарь только с current_date.
+    """
+    if validators is not None and validators.etag:
+        headers = {**headers, 'If-None-Match': validators.etag}
     requests_pars = dict(
         url=ENDPOINT,
-        headers=HEADERS,
-        params={'from_date': {timestamp}}
+        headers=headers,
+        params={'from_date': timestamp},
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        stream=not timestamp
     )
     try:
-        homework_statuses = requests.get(**requests_pars)
+        homework_statuses = http_get(**requests_pars)
     except RequestException as error:
         raise ConnectionError(
             ERROR_CONNECT_PHRASE.format(
                 error=error,
-                **requests_pars
+                **redacted(requests_pars)
             ))
     status_code = homework_statuses.status_code
-    if status_code != HTTPStatus.OK:
-        raise ApiResponseError(
-            NOT_CORRECT_CODE_PHRASE.format(
-                status_code=status_code,
-                **requests_pars
-            ))
-    data = homework_statuses.json()
+    if status_code != HTTPStatus.OK and requests_pars['stream']:
+        release(homework_statuses)
+    if status_code == HTTPStatus.NOT_MODIFIED and validators is not None:
+        return {}, validators
+    check_status_code(homework_statuses, redacted(requests_pars))
+    fresh = None
+    if not requests_pars['stream']:
+        fresh = body_validators(homework_statuses)
+        if fresh is not None and fresh == validators:
+            return current_date(homework_statuses), fresh
+    data = decode_response(homework_statuses, requests_pars['stream'])
     for key in ['error', 'code']:
         if key in data:
             raise ApiResponseDataError(
                 ERROR_KEY_PHRASE.format(
                     key=key,
                     value=data[key],
-                    **requests_pars
+                    **redacted(requests_pars)
                 ))
-    return data
+    return data, fresh
+
+
+def redacted(requests_pars):
+    """Параметры запроса для текста ошибки, без токена Практикума.
+
+    Текст ошибки уходит в чаты подписки и в хранилище очереди сообщений,
+    поэтому заголовок Authorization в нём заменяется заглушкой.
+    """
+    headers = dict(requests_pars['headers'])
+    if 'Authorization' in headers:
+        headers['Authorization'] = REDACTED
+    return dict(requests_pars, headers=headers)
+
+
+def check_status_code(homework_statuses, requests_pars):
+    """Исключение для ответа API с кодом, отличным от 200."""
+    status_code = homework_statuses.status_code
+    if status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        raise ApiRateLimitError(
+            NOT_CORRECT_CODE_PHRASE.format(
+                status_code=status_code,
+                **requests_pars
+            ),
+            status_code=status_code,
+            retry_after=retry_after(homework_statuses.headers)
+        )
+    if status_code != HTTPStatus.OK:
+        raise ApiResponseError(
+            NOT_CORRECT_CODE_PHRASE.format(
+                status_code=status_code,
+                **requests_pars
+            ),
+            status_code=status_code
+        )
+
+
+def retry_after(headers):
+    """Пауза в секундах из заголовка Retry-After, либо None."""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
 
 
 def check_response(response):
-    """Проверка ответа от сервиса Практикум Домашка по API."""
+    """Проверка ответа от сервиса Практикум Домашка по API.
+
+    Возвращает список записей Homework, собранных за один проход
+    по homeworks; словари ответа дальше не хранятся.
+    """
     if not isinstance(response, dict):
         raise TypeError(NEED_DICT_PHRASE.format(response=type(response)))
     if 'homeworks' not in response:
@@ -137,21 +240,36 @@ def check_response(response):
         raise TypeError(NEED_KEY_HM_PHRASE.format(
             type=type(homeworks)
         ))
-    return homeworks
+    return [Homework.from_dict(homework) for homework in homeworks]
+
+
+def next_cursor(response, timestamp):
+    """Курсор from_date после полностью обработанного ответа.
+
+    Курсор отстаёт от current_date на CURSOR_OVERLAP секунд, чтобы
+    изменения, записанные API с опозданием, попали в следующий ответ;
+    повторно пришедшие статусы отсеивает индекс работ. Назад курсор
+    не сдвигается.
+    """
+    current_date = response.get('current_date')
+    if not isinstance(current_date, int):
+        return timestamp
+    return max(timestamp, current_date - CURSOR_OVERLAP)
 
 
 def parse_status(homework):
-    """Парсинг ответа от Практикум."""
-    if 'homework_name' not in homework:
+    """Парсинг ответа от Практикум: запись Homework или словарь работы."""
+    if not isinstance(homework, Homework):
+        homework = Homework.from_dict(homework)
+    if homework.name is None:
         raise KeyError(NOT_FOUND_NAME_PHRASE)
-    if 'status' not in homework:
+    if homework.status is None:
         raise KeyError(NOT_FOUND_STATUS_PHRASE)
-    status = homework['status']
-    if status not in HOMEWORK_VERDICTS:
-        raise ValueError(STATUS_ERROR_PHRASE.format(status=status))
+    if not isinstance(homework.status, HomeworkStatus):
+        raise ValueError(STATUS_ERROR_PHRASE.format(status=homework.status))
     return (STATUS_CHANGE.format(
-        name=homework['homework_name'],
-        status=HOMEWORK_VERDICTS[status])
+        name=homework.name,
+        status=HOMEWORK_VERDICTS[homework.status.value])
     )
 
 
@@ -160,25 +278,58 @@ def main():
     check_tokens()
 
     bot = TeleBot(token=TELEGRAM_TOKEN)
-    timestamp = 0
-    sent_message = ''
+    store = StateStore()
+    state_key = token_key(PRACTICUM_TOKEN)
+    timestamp, sent_message = store.load_state(state_key, TELEGRAM_CHAT_ID)
+    index = HomeworkIndex(store.load_statuses(state_key, TELEGRAM_CHAT_ID))
+    errors = ErrorDigest()
+    WATCHDOG.start()
     while True:
         try:
+            WATCHDOG.busy('main')
             response = get_api_answer(timestamp)
             homeworks = check_response(response)
+            WATCHDOG.beat('poll')
             if not homeworks:
                 logging.debug(NO_HOMEWORKS_PHRASE)
-                continue
-            verdict = parse_status(homeworks[0])
-            if verdict != sent_message and send_message(bot, verdict):
+            for homework in index.seed(homeworks):
+                store.save_status(
+                    state_key, TELEGRAM_CHAT_ID, homework.key, homework.status
+                )
+            changed = index.diff(homeworks)
+            delivered = 0
+            for homework in changed:
+                verdict = parse_status(homework)
+                if not send_message(bot, verdict):
+                    break
+                store.save_status(
+                    state_key, TELEGRAM_CHAT_ID,
+                    index.commit(homework), homework.status
+                )
                 sent_message = verdict
-                timestamp = response.get('current_date', timestamp)
+                delivered += 1
+            if delivered == len(changed):
+                timestamp = next_cursor(response, timestamp)
+            store.save_state(
+                state_key, TELEGRAM_CHAT_ID, timestamp, sent_message
+            )
         except Exception as error:
             message = ERROR_PHRASE.format(error=error)
             logging.error(message)
-            if message != sent_message and send_message(bot, message):
+            message = errors.add(error, message)
+            if (
+                message and message != sent_message
+                and send_message(bot, message)
+            ):
                 sent_message = message
+                store.save_state(
+                    state_key, TELEGRAM_CHAT_ID, timestamp, sent_message
+                )
         finally:
+            WATCHDOG.idle('main')
+            summary = errors.summary()
+            if summary:
+                send_message(bot, summary)
             time.sleep(RETRY_PERIOD)
 
 
@@ -0,0 +1,98 @@
+"""Метрики процесса: счётчики, текущие значения и тайминги."""
+import threading
+from collections import Counter
+
+
+class Metrics:
+    """Потокобезопасный реестр метрик для периодического отчёта в лог."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.gauges = {}
+        self.timings = {}
+
+    def inc(self, name, value=1):
+        """Увеличение счётчика."""
+        with self.lock:
+            self.counters[name] += value
+
+    def gauge(self, name, value):
+        """Запись текущего значения показателя."""
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Учёт длительности операции: количество, сумма и максимум."""
+        with self.lock:
+            count, total, longest = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = (
+                count + 1, total + seconds, max(longest, seconds)
+            )
+
+    def ratio(self, hits, misses):
+        """Доля счётчика hits в сумме счётчиков hits и misses."""
+        with self.lock:
+            total = self.counters[hits] + self.counters[misses]
+            return round(self.counters[hits] / total, 4) if total else 0.0
+
+    def snapshot(self):
+        """Снимок всех метрик в виде словаря."""
+        with self.lock:
+            timings = {
+                name: {
+                    'count': count,
+                    'avg': round(total / count, 4),
+                    'max': round(longest, 4),
+                }
+                for name, (count, total, longest) in self.timings.items()
+            }
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'timings': timings,
+            }
+
+
+METRICS = Metrics()
+
+
+class PhaseHistogram:
+    """Распределение запросов по фазе внутри периода опроса.
+
+    Период делится на buckets корзин; rates() возвращает среднее число
+    запросов в секунду для каждой корзины за всё время наблюдения.
+    """
+
+    def __init__(self, period, buckets=60):
+        self.period = period
+        self.width = period / buckets
+        self.counts = [0] * buckets
+        self.first = None
+        self.last = None
+
+    def record(self, moment):
+        """Учёт запроса, отправленного в момент moment (секунды)."""
+        if self.first is None:
+            self.first = moment
+        self.last = moment
+        self.counts[int(moment % self.period // self.width)] += 1
+
+    def rates(self):
+        """Запросов в секунду по корзинам периода."""
+        if self.first is None:
+            return [0.0] * len(self.counts)
+        cycles = max(1.0, (self.last - self.first) / self.period)
+        return [
+            round(count / (cycles * self.width), 3) for count in self.counts
+        ]
+
+    def render(self):
+        """Текстовая гистограмма: одна строка на корзину."""
+        rates = self.rates()
+        peak = max(rates) or 1
+        return '\n'.join(
+            f'{index * self.width:>6.0f}s {rate:>8.3f} rps '
+            + '#' * round(rate / peak * 40)
+            for index, rate in enumerate(rates)
+        )
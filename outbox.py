@@ -0,0 +1,509 @@
+"""Очередь исходящих сообщений Telegram с ограничением частоты."""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from http import HTTPStatus
+from typing import Callable, Optional
+
+from telebot.apihelper import ApiTelegramException
+
+from homework import PHRASE_NO_SEND_MESSAGE, PHRASE_SEND_MESSAGE
+from heartbeat import WATCHDOG
+from metrics import METRICS
+from resilience import TokenBucket
+from storage import token_key
+
+OUTBOX_SIZE = int(os.getenv('OUTBOX_SIZE', 10000))
+SENDER_WORKERS = int(os.getenv('SENDER_WORKERS', 8))
+TELEGRAM_RATE = float(os.getenv('TELEGRAM_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+OUTBOX_RETRY_DELAY = float(os.getenv('OUTBOX_RETRY_DELAY', 2))
+OUTBOX_MAX_RETRY_DELAY = float(os.getenv('OUTBOX_MAX_RETRY_DELAY', 300))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 10))
+OUTBOX_LANE_SHARES = tuple(
+    float(share)
+    for share in os.getenv('OUTBOX_LANE_SHARES', '1,0.5,0.2').split(',')
+)
+TELEGRAM_MAX_LENGTH = 4096
+LANE_VERDICT, LANE_REVIEWING, LANE_ERROR = range(3)
+PERMANENT_ERRORS = (HTTPStatus.BAD_REQUEST, HTTPStatus.FORBIDDEN)
+MESSAGE_SEPARATOR = '\n\n'
+
+FLOOD_CONTROL_PHRASE = (
+    'Telegram ограничил отправку в чат {chat_id}, '
+    'повтор через {retry_after} с.'
+)
+DELIVERY_RETRY_PHRASE = (
+    'Повтор отправки в чат {chat_id} через {delay:.1f} с, попытка {attempt}.'
+)
+DELIVERY_DROPPED_PHRASE = (
+    'Сообщение для чата {chat_id} отброшено после {attempts} попыток.'
+)
+
+
+@dataclass
+class Notification:
+    """Сообщение для отправки в чат."""
+
+    chat_id: str
+    text: str
+    key: Optional[str] = None
+    on_delivered: Optional[Callable] = field(default=None, repr=False)
+    on_dropped: Optional[Callable] = field(default=None, repr=False)
+    enqueued: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    priority: int = LANE_VERDICT
+
+
+def flood_retry_after(error):
+    """Пауза из ответа Telegram 429, либо None для прочих ошибок."""
+    if error.error_code != HTTPStatus.TOO_MANY_REQUESTS:
+        return None
+    return error.result_json.get('parameters', {}).get('retry_after', 1)
+
+
+def is_permanent(error):
+    """Ошибка, при которой повтор отправки бесполезен."""
+    return (
+        isinstance(error, ApiTelegramException)
+        and error.error_code in PERMANENT_ERRORS
+    )
+
+
+def status_lane(status):
+    """Полоса приоритета для сообщения о статусе работы."""
+    return LANE_REVIEWING if status == 'reviewing' else LANE_VERDICT
+
+
+def best_lane(queue):
+    """Наивысший приоритет среди сообщений очереди чата."""
+    return min(notification.priority for notification in queue.values())
+
+
+def slot_key(notification):
+    """Ключ идемпотентности сообщения в очереди чата.
+
+    Для сообщений без ключа им служит хеш текста, поэтому одинаковые
+    сообщения в чат не дублируются.
+    """
+    if notification.key is None:
+        return 'text:' + hashlib.sha256(
+            notification.text.encode()
+        ).hexdigest()[:16]
+    return notification.key
+
+
+class Outbox:
+    """Ограниченная очередь сообщений, разбираемая отправителями.
+
+    Сообщения копятся по чатам; чат стоит в полосе приоритета своего
+    самого важного сообщения не более одного раза, поэтому внутри
+    полосы чаты обслуживаются по кругу. Вердикты идут раньше
+    сообщений о взятии на проверку, а те — раньше сообщений об
+    ошибках; у каждой полосы своя доля lane_shares общего лимита,
+    так что поток ошибок не занимает всю отправку. Новое сообщение
+    с тем же ключом (той же работе) заменяет ещё не отправленное,
+    а всё, что накопилось в чате, уходит одним сообщением в пределах
+    TELEGRAM_MAX_LENGTH. Каждая отправка укладывается в общий лимит
+    бота и в лимит своего чата.
+
+    Вместо одного бота можно передать список: чат, закреплённый
+    через assign(), пишет только его бот, остальные — первый (основной)
+    бот. У каждого бота свой лимит rate, так что общий предел отправки
+    растёт с числом ботов.
+
+    С хранилищем store очередь переживает перезапуск: сообщение
+    записывается при постановке и удаляется после доставки, неудачная
+    отправка повторяется с экспоненциальной паузой (доставка
+    «хотя бы один раз»).
+    """
+
+    def __init__(
+            self, bot, size=OUTBOX_SIZE, workers=SENDER_WORKERS,
+            rate=TELEGRAM_RATE, chat_rate=TELEGRAM_CHAT_RATE, store=None,
+            lane_shares=OUTBOX_LANE_SHARES
+    ):
+        self.bots = list(bot) if isinstance(bot, (list, tuple)) else [bot]
+        self.shards = [
+            token_key(getattr(item, 'token', None) or index)
+            for index, item in enumerate(self.bots)
+        ]
+        self.store = store
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='send'
+        )
+        self.buckets = [TokenBucket(rate) for _ in self.bots]
+        self.assigned = {}
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.pending = {}
+        self.sending = {}
+        self.retries = set()
+        self.lanes = [deque() for _ in lane_shares]
+        self.lane_buckets = [
+            TokenBucket(rate * len(self.bots) * share)
+            for share in lane_shares
+        ]
+        self.lane_of = {}
+        self.wakeup = asyncio.Event()
+        self.unfinished = 0
+        self.finished = asyncio.Event()
+        self.slots = asyncio.Semaphore(size)
+        self.depth = 0
+
+    async def put(self, notification):
+        """Постановка сообщения в очередь; ждёт, если очередь заполнена.
+
+        Сообщение, совпадающее с отправляемым прямо сейчас, повторно
+        не ставится; сообщение с ключом, уже стоящим в очереди чата,
+        занимает место прежнего.
+        """
+        chat_id, key = notification.chat_id, slot_key(notification)
+        sending = self.sending.get((chat_id, key))
+        if sending is not None and sending.text == notification.text:
+            sending.on_delivered = (
+                sending.on_delivered or notification.on_delivered
+            )
+            sending.on_dropped = (
+                sending.on_dropped or notification.on_dropped
+            )
+            return
+        if self.supersede(notification):
+            return
+        await self.slots.acquire()
+        if self.supersede(notification):
+            self.slots.release()
+            return
+        self.depth += 1
+        METRICS.gauge('outbox.depth', self.depth)
+        self.save(notification)
+        queue = self.pending.get(chat_id)
+        if queue is None:
+            self.pending[chat_id] = OrderedDict([(key, notification)])
+            self.push(chat_id, notification.priority)
+            return
+        queue[key] = notification
+        if chat_id in self.lane_of:
+            self.push(chat_id, notification.priority)
+
+    def push(self, chat_id, lane):
+        """Постановка чата в полосу; ждущий чат поднимается в более важную.
+
+        Чат, сообщения которого сейчас отправляются, в полосах не стоит:
+        отправитель вернёт его сам.
+        """
+        current = self.lane_of.get(chat_id)
+        if current is not None and current <= lane:
+            return
+        if current is None:
+            self.unfinished += 1
+        else:
+            self.lanes[current].remove(chat_id)
+        self.lanes[lane].append(chat_id)
+        self.lane_of[chat_id] = lane
+        self.wakeup.set()
+
+    async def next_chat(self):
+        """Чат из самой важной полосы, укладывающейся в свою долю лимита."""
+        while True:
+            delays = []
+            for lane, chats in enumerate(self.lanes):
+                if not chats:
+                    continue
+                delay = self.lane_buckets[lane].wait_time()
+                if not delay:
+                    self.lane_buckets[lane].reserve()
+                    chat_id = chats.popleft()
+                    del self.lane_of[chat_id]
+                    return chat_id
+                delays.append(delay)
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self.wakeup.wait(), min(delays, default=None)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def task_done(self):
+        """Завершение обработки чата, взятого из полосы."""
+        self.unfinished -= 1
+        if not self.unfinished:
+            self.finished.set()
+
+    async def join(self):
+        """Ожидание, пока все чаты в полосах не будут обработаны."""
+        while self.unfinished:
+            self.finished.clear()
+            await self.finished.wait()
+
+    def supersede(self, notification):
+        """Замена ждущего сообщения с тем же ключом; True, если заменено."""
+        queue = self.pending.get(notification.chat_id)
+        key = slot_key(notification)
+        if not queue or key not in queue:
+            return False
+        notification.enqueued = queue[key].enqueued
+        queue[key] = notification
+        METRICS.inc('outbox.superseded')
+        self.save(notification)
+        if notification.chat_id in self.lane_of:
+            self.push(notification.chat_id, notification.priority)
+        return True
+
+    def save(self, notification):
+        """Запись сообщения в хранилище до его доставки."""
+        if self.store is not None:
+            self.store.save_message(
+                notification.chat_id, slot_key(notification),
+                notification.text, notification.priority
+            )
+
+    async def restore(self):
+        """Постановка в очередь сообщений, не доставленных до перезапуска."""
+        if self.store is None:
+            return
+        for chat_id, key, text, priority in self.store.load_messages():
+            METRICS.inc('outbox.restored')
+            await self.put(
+                Notification(chat_id, text, key=key, priority=priority)
+            )
+
+    def take(self, queue):
+        """Снятие с очереди чата сообщений, умещающихся в одно.
+
+        Сообщения берутся в порядке приоритета, а внутри полосы —
+        в порядке постановки.
+        """
+        batch = []
+        length = -len(MESSAGE_SEPARATOR)
+        for key, notification in sorted(
+            queue.items(), key=lambda item: item[1].priority
+        ):
+            length += len(MESSAGE_SEPARATOR) + len(notification.text)
+            if batch and length > TELEGRAM_MAX_LENGTH:
+                break
+            batch.append(queue.pop(key))
+        return batch
+
+    def assign(self, chat_id, token):
+        """Закрепление чата за ботом с токеном token.
+
+        Писать в чат может только бот, которого в нём запустили, поэтому
+        чаты не распределяются по ботам автоматически: без token чат
+        остаётся за основным ботом.
+        """
+        if token:
+            self.assigned[chat_id] = self.shards.index(token_key(token))
+
+    def shard(self, chat_id):
+        """Номер бота, закреплённого за чатом."""
+        return self.assigned.get(chat_id, 0)
+
+    def chat_bucket(self, chat_id):
+        """Лимит частоты отправки в чат."""
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return self.chat_buckets[chat_id]
+
+    async def deliver(self, chat_id, batch):
+        """Отправка пакета одним сообщением."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        text = MESSAGE_SEPARATOR.join(
+            notification.text for notification in batch
+        )
+        shard = self.shard(chat_id)
+        try:
+            await loop.run_in_executor(self.executor, partial(
+                self.bots[shard].send_message, chat_id=chat_id, text=text
+            ))
+        finally:
+            METRICS.observe('telegram.send', loop.time() - start)
+        logging.debug(PHRASE_SEND_MESSAGE.format(message=text))
+        METRICS.inc('telegram.sent')
+        METRICS.inc(f'telegram.bot{shard}.sent')
+        WATCHDOG.beat('send')
+        METRICS.inc('outbox.coalesced', len(batch) - 1)
+        self.release(batch)
+        for notification in batch:
+            METRICS.observe(
+                'outbox.latency', loop.time() - notification.enqueued
+            )
+            if notification.on_delivered:
+                notification.on_delivered(notification.text)
+
+    def failed(self, chat_id, batch, error):
+        """Учёт неудачной отправки и планирование повтора.
+
+        Отброшенные сообщения сообщают об этом через on_dropped, чтобы
+        их отправитель не ждал доставки вечно.
+        """
+        METRICS.inc('telegram.failed')
+        logging.exception(PHRASE_NO_SEND_MESSAGE.format(
+            message=MESSAGE_SEPARATOR.join(
+                notification.text for notification in batch
+            ),
+            error=error
+        ))
+        attempt = max(notification.attempts for notification in batch) + 1
+        if is_permanent(error) or attempt >= OUTBOX_MAX_ATTEMPTS:
+            METRICS.inc('outbox.dropped', len(batch))
+            logging.error(DELIVERY_DROPPED_PHRASE.format(
+                chat_id=chat_id, attempts=attempt
+            ))
+            self.release(batch)
+            for notification in batch:
+                if notification.on_dropped:
+                    notification.on_dropped()
+            return
+        for notification in batch:
+            notification.attempts = attempt
+        delay = min(
+            OUTBOX_RETRY_DELAY * 2 ** (attempt - 1), OUTBOX_MAX_RETRY_DELAY
+        )
+        delay = random.uniform(delay / 2, delay)
+        METRICS.inc('outbox.retried')
+        logging.warning(DELIVERY_RETRY_PHRASE.format(
+            chat_id=chat_id, delay=delay, attempt=attempt
+        ))
+        retry = asyncio.ensure_future(self.retry(delay, chat_id, batch))
+        self.retries.add(retry)
+        retry.add_done_callback(self.retries.discard)
+
+    async def retry(self, delay, chat_id, batch):
+        """Возврат пакета в очередь чата после паузы."""
+        await asyncio.sleep(delay)
+        self.requeue(chat_id, batch)
+
+    def release(self, batch):
+        """Освобождение мест доставленных или отброшенных сообщений.
+
+        Если за время отправки с тем же ключом поставлено более новое
+        сообщение, запись в хранилище уже принадлежит ему и остаётся.
+        """
+        self.depth -= len(batch)
+        for notification in batch:
+            self.slots.release()
+            key = slot_key(notification)
+            if self.store is None or key in self.pending.get(
+                notification.chat_id, ()
+            ):
+                continue
+            self.store.delete_message(notification.chat_id, key)
+
+    def requeue(self, chat_id, batch):
+        """Возврат пакета в начало очереди чата.
+
+        Сообщения, которые за время отправки заменены более новыми,
+        не возвращаются.
+        """
+        queue = self.pending.get(chat_id)
+        idle = queue is None
+        if idle:
+            queue = self.pending[chat_id] = OrderedDict()
+        for notification in reversed(batch):
+            key = slot_key(notification)
+            if key in queue:
+                METRICS.inc('outbox.superseded')
+                self.depth -= 1
+                self.slots.release()
+                continue
+            queue[key] = notification
+            queue.move_to_end(key, last=False)
+        if idle and queue:
+            self.push(chat_id, best_lane(queue))
+        elif idle:
+            del self.pending[chat_id]
+        METRICS.gauge('outbox.depth', self.depth)
+
+    async def send(self, chat_id, batch, name='send'):
+        """Отправка пакета с учётом лимитов, флуд-контроля и ошибок.
+
+        Сторож следит только за самой отправкой (name): ожидание лимитов,
+        в том числе паузы флуд-контроля дольше WATCHDOG_STALL, зависанием
+        не считается.
+        """
+        for notification in batch:
+            self.sending[chat_id, slot_key(notification)] = notification
+        try:
+            await self.chat_bucket(chat_id).acquire()
+            await self.buckets[self.shard(chat_id)].acquire()
+            WATCHDOG.busy(name)
+            try:
+                await self.deliver(chat_id, batch)
+            finally:
+                WATCHDOG.idle(name)
+        except asyncio.CancelledError:
+            self.requeue(chat_id, batch)
+            raise
+        except ApiTelegramException as error:
+            retry_after = flood_retry_after(error)
+            if retry_after is None:
+                self.failed(chat_id, batch, error)
+            else:
+                METRICS.inc('telegram.throttled')
+                logging.warning(FLOOD_CONTROL_PHRASE.format(
+                    chat_id=chat_id, retry_after=retry_after
+                ))
+                self.chat_bucket(chat_id).pause(retry_after)
+                self.requeue(chat_id, batch)
+        except Exception as error:
+            self.failed(chat_id, batch, error)
+        finally:
+            for notification in batch:
+                self.sending.pop((chat_id, slot_key(notification)), None)
+
+    async def sender(self, name='send'):
+        """Отправитель: берёт очередной чат и отправляет ему накопленное.
+
+        Если сторож отменит зависшую отправку, сообщения возвращаются
+        в очередь чата.
+        """
+        while True:
+            chat_id = await self.next_chat()
+            queue = self.pending[chat_id]
+            try:
+                await self.send(chat_id, self.take(queue), name)
+            finally:
+                if queue:
+                    self.push(chat_id, best_lane(queue))
+                else:
+                    del self.pending[chat_id]
+                METRICS.gauge('outbox.depth', self.depth)
+                self.task_done()
+
+    async def run(self):
+        """Восстановление сохранённых сообщений и запуск отправителей."""
+        await asyncio.gather(self.restore(), *(
+            self.sender(f'send{index}') for index in range(self.workers)
+        ))
+
+    async def drain(self):
+        """Отправка всего, что уже стоит в очереди, включая повторы."""
+        senders = [
+            asyncio.ensure_future(self.sender(f'send{index}'))
+            for index in range(self.workers)
+        ]
+        try:
+            await self.join()
+            while self.retries:
+                await asyncio.gather(*self.retries)
+                await self.join()
+        finally:
+            for sender in senders:
+                sender.cancel()
+
+    def close(self):
+        """Остановка пула потоков отправки и отложенных повторов."""
+        for retry in self.retries:
+            retry.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
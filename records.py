@@ -0,0 +1,71 @@
+"""Компактные записи о домашних работах из ответа API."""
+import sys
+from enum import Enum
+
+NEED_HOMEWORK_DICT_PHRASE = (
+    'Ожидается, что работа — словарь, а получили: {homework}.'
+)
+
+
+class HomeworkStatus(str, Enum):
+    """Известные статусы проверки.
+
+    Члены перечисления — по одному объекту на статус, поэтому записи
+    и индексы всех подписок ссылаются на них, а не на свои копии строк.
+    Со строками они сравниваются и хешируются как строки.
+    """
+
+    APPROVED = 'approved'
+    REVIEWING = 'reviewing'
+    REJECTED = 'rejected'
+
+
+def intern_status(status):
+    """Статус как член HomeworkStatus; неизвестный остаётся строкой."""
+    try:
+        return HomeworkStatus(status)
+    except ValueError:
+        if isinstance(status, str):
+            return sys.intern(status)
+        return status
+
+
+def homework_key(homework):
+    """Ключ работы в индексе: id, а для ответов без id — название."""
+    return str(homework.get('id', homework.get('homework_name')))
+
+
+class Homework:
+    """Запись о работе: только поля, которые нужны боту.
+
+    Отсутствующие в ответе название и статус хранятся как None,
+    их проверяет parse_status.
+    """
+
+    __slots__ = ('key', 'name', 'status')
+
+    def __init__(self, key, name=None, status=None):
+        self.key = key
+        self.name = name
+        self.status = status
+
+    @classmethod
+    def from_dict(cls, homework):
+        """Запись из словаря ответа API за один проход по его ключам."""
+        if not isinstance(homework, dict):
+            raise TypeError(
+                NEED_HOMEWORK_DICT_PHRASE.format(homework=type(homework))
+            )
+        status = homework.get('status')
+        return cls(
+            sys.intern(homework_key(homework)),
+            homework.get('homework_name'),
+            None if status is None else intern_status(status)
+        )
+
+    def __repr__(self):
+        """Запись в виде Homework(key, name, status)."""
+        return (
+            f'{type(self).__name__}({self.key!r}, '
+            f'{self.name!r}, {self.status!r})'
+        )
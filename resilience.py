@@ -0,0 +1,217 @@
+"""Защита от сбоев и перегрузки API: размыкатель цепи и лимиты частоты."""
+import asyncio
+import os
+import random
+import time
+from functools import partial
+from http import HTTPStatus
+
+from exceptions import ApiResponseError
+from metrics import METRICS
+
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 3))
+BREAKER_BASE_DELAY = float(os.getenv('BREAKER_BASE_DELAY', 60))
+BREAKER_MAX_DELAY = float(os.getenv('BREAKER_MAX_DELAY', 3600))
+PRACTICUM_RATE = float(os.getenv('PRACTICUM_RATE', 10))
+PRACTICUM_BURST = float(os.getenv('PRACTICUM_BURST', 10))
+PRACTICUM_MIN_RATE = float(os.getenv('PRACTICUM_MIN_RATE', 0.5))
+DEFAULT_RETRY_AFTER = float(os.getenv('DEFAULT_RETRY_AFTER', 60))
+RATE_STEP = 0.01
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def is_outage(error):
+    """Сбой на стороне API или сети, а не конкретного токена."""
+    if isinstance(error, ConnectionError):
+        return True
+    return (
+        isinstance(error, ApiResponseError)
+        and error.status_code is not None
+        and error.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+    )
+
+
+class CircuitBreaker:
+    """Размыкатель цепи.
+
+    После threshold ошибок подряд размыкается и не пропускает запросы
+    до retry_at. Затем пропускает один пробный запрос: успех замыкает
+    цепь, ошибка снова размыкает её с вдвое большей паузой.
+    Пауза выбирается случайно из [delay / 2, delay].
+    """
+
+    def __init__(
+            self, threshold=BREAKER_THRESHOLD, base_delay=BREAKER_BASE_DELAY,
+            max_delay=BREAKER_MAX_DELAY, clock=time.monotonic
+    ):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+
+    def allow(self):
+        """Можно ли выполнить запрос сейчас."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.clock() >= self.retry_at:
+            self.state = HALF_OPEN
+            return True
+        return False
+
+    def success(self):
+        """Учёт успешного запроса: цепь замыкается."""
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def failure(self):
+        """Учёт ошибки; True, если цепь только что разомкнулась."""
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            opened = self.state == CLOSED
+            self.trip()
+            return opened
+        return False
+
+    def hold(self, seconds=None):
+        """Пробный запрос не состоялся (429 или отмена).
+
+        Разомкнутая или пробующая цепь снова размыкается не раньше чем
+        через seconds секунд (DEFAULT_RETRY_AFTER, если не задано), пауза
+        не растёт и ошибка не засчитывается. Замкнутая цепь не меняется.
+        """
+        if self.state == CLOSED:
+            return
+        seconds = DEFAULT_RETRY_AFTER if seconds is None else seconds
+        self.retry_at = max(self.retry_at, self.clock() + seconds)
+        self.state = OPEN
+
+    def trip(self):
+        """Размыкание цепи с экспоненциальной паузой и джиттером."""
+        self.trips += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.trips - 1))
+        self.retry_at = self.clock() + random.uniform(delay / 2, delay)
+        self.state = OPEN
+
+
+class TokenBucket:
+    """Корзина токенов: rate запросов в секунду с запасом до capacity.
+
+    reserve() всегда выдаёт токен, но в долг: возвращает паузу,
+    после которой запрос укладывается в лимит. Так ожидающие запросы
+    выстраиваются ровно с шагом 1 / rate, а не ломятся разом.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+        """Начисление токенов за прошедшее время, возвращает текущее время."""
+        now = self.clock()
+        if now > self.updated:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+        return now
+
+    def wait_time(self):
+        """Пауза до появления целого токена, без его резерва."""
+        now = self.refill()
+        return (
+            max(0.0, self.updated - now)
+            + max(0.0, 1 - self.tokens) / self.rate
+        )
+
+    def reserve(self):
+        """Резерв одного токена; пауза в секундах до его наступления."""
+        now = self.refill()
+        self.tokens -= 1
+        return (
+            max(0.0, self.updated - now)
+            + max(0.0, -self.tokens) / self.rate
+        )
+
+    def pause(self, seconds):
+        """Приостановка выдачи токенов на seconds секунд."""
+        now = self.refill()
+        self.updated = max(self.updated, now + seconds)
+
+    async def acquire(self):
+        """Ожидание своей очереди в пределах лимита."""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class RateBudget(TokenBucket):
+    """Общий лимит запросов к API, подстраивающийся под ответы 429.
+
+    На 429 частота уменьшается вдвое, а выдача токенов
+    приостанавливается на Retry-After; пачка 429 в пределах одной
+    паузы снижает частоту один раз. Каждый успешный запрос
+    возвращает частоту на долю от максимальной.
+    """
+
+    def __init__(
+            self, rate=PRACTICUM_RATE, capacity=PRACTICUM_BURST,
+            min_rate=PRACTICUM_MIN_RATE, clock=time.monotonic
+    ):
+        super().__init__(rate, capacity, clock)
+        self.max_rate = rate
+        self.min_rate = min_rate
+
+    def throttle(self, retry_after=None):
+        """Реакция на 429: пауза и снижение частоты."""
+        now = self.refill()
+        if self.updated <= now:
+            self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        self.pause(DEFAULT_RETRY_AFTER if retry_after is None else retry_after)
+
+    def success(self):
+        """Плавное восстановление частоты после успешного запроса."""
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_STEP)
+
+
+class SingleFlight:
+    """Один запрос на ключ: одновременные запросы ждут общий результат.
+
+    Запрос с курсором since присоединяется к уже выполняющемуся, если
+    тот начат с курсора не позже: ответ с более ранней from_date
+    содержит все нужные изменения. Отмена одного из ожидающих
+    (например, по сроку) не прерывает общий запрос.
+    """
+
+    def __init__(self):
+        self.flights = {}
+
+    async def do(self, key, since, factory):
+        """Результат factory() для ключа key, общий для одновременных."""
+        flight = self.flights.get(key)
+        if flight is not None and flight[0] <= since:
+            METRICS.inc('singleflight.shared')
+            return await asyncio.shield(flight[1])
+        task = asyncio.ensure_future(factory())
+        self.flights[key] = (since, task)
+        task.add_done_callback(partial(self.land, key))
+        return await asyncio.shield(task)
+
+    def land(self, key, task):
+        """Снятие завершённого запроса."""
+        if self.flights.get(key, (None, None))[1] is task:
+            del self.flights[key]
+        if not task.cancelled():
+            task.exception()
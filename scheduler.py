@@ -0,0 +1,108 @@
+"""Планирование опросов подписок."""
+import math
+import os
+import random
+
+from homework import RETRY_PERIOD
+
+REVIEWING_PERIOD = int(os.getenv('REVIEWING_PERIOD', 120))
+APPROVED_PERIOD = int(os.getenv('APPROVED_PERIOD', 1800))
+MAX_POLL_PERIOD = int(os.getenv('MAX_POLL_PERIOD', 3600))
+IDLE_BACKOFF = float(os.getenv('IDLE_BACKOFF', 1.5))
+POLL_JITTER = float(os.getenv('POLL_JITTER', 0.1))
+
+WHEEL_HORIZON_PHRASE = 'Момент {due} за пределами колеса таймеров.'
+
+POLL_PERIODS = {
+    'reviewing': REVIEWING_PERIOD,
+    'rejected': RETRY_PERIOD,
+    'approved': APPROVED_PERIOD,
+}
+
+
+def next_interval(status, interval, changed):
+    """Интервал до следующего опроса по последнему статусу подписки.
+
+    Пока работа на проверке, опрос идёт часто. В остальных статусах
+    базовый интервал растёт с каждым опросом без изменений,
+    но не выше MAX_POLL_PERIOD; любое изменение сбрасывает его.
+    """
+    base = POLL_PERIODS.get(status, RETRY_PERIOD)
+    if status == 'reviewing' or changed or not interval:
+        return base
+    return min(max(interval, base) * IDLE_BACKOFF, MAX_POLL_PERIOD)
+
+
+def poll_phase(key, period=RETRY_PERIOD):
+    """Стабильный сдвиг первого опроса внутри периода по ключу токена.
+
+    Сдвиг не меняется между перезапусками, поэтому опросы после
+    одновременного рестарта распределены по периоду, а не идут разом.
+    """
+    return int(key, 16) % int(period * 1000) / 1000
+
+
+def jittered(interval, jitter=POLL_JITTER):
+    """Интервал со случайным отклонением в пределах ±jitter."""
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+
+class TimingWheel:
+    """Иерархическое колесо таймеров.
+
+    Уровень l хранит записи, срабатывающие через slots ** l тиков и позже.
+    Вставка и срабатывание стоят O(1): при переходе через границу оборота
+    записи верхнего уровня один раз переносятся на уровень ниже.
+    """
+
+    def __init__(self, origin, tick=1.0, slots=64, levels=4):
+        self.origin = origin
+        self.tick = tick
+        self.slots = slots
+        self.spans = [slots ** level for level in range(levels + 1)]
+        self.levels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current = 0
+        self.ready = []
+        self.size = 0
+
+    def schedule(self, item, due):
+        """Постановка элемента на момент due (время того же источника)."""
+        due_tick = math.ceil((due - self.origin) / self.tick)
+        self.size += 1
+        self.place((due_tick, due, item))
+
+    def place(self, entry):
+        """Размещение записи на уровне, соответствующем её удалённости."""
+        due_tick = entry[0]
+        if due_tick <= self.current:
+            self.ready.append(entry)
+            return
+        for level, span in enumerate(self.spans[:-1]):
+            if due_tick // span - self.current // span < self.slots:
+                self.levels[level][due_tick // span % self.slots].append(entry)
+                return
+        raise ValueError(WHEEL_HORIZON_PHRASE.format(due=entry[1]))
+
+    def step(self):
+        """Сдвиг колеса на один тик с переносом записей верхних уровней."""
+        self.current += 1
+        for level in range(len(self.levels) - 1, 0, -1):
+            if self.current % self.spans[level] == 0:
+                slot = self.current // self.spans[level] % self.slots
+                entries = self.levels[level][slot]
+                self.levels[level][slot] = []
+                for entry in entries:
+                    self.place(entry)
+        slot = self.current % self.slots
+        self.ready.extend(self.levels[0][slot])
+        self.levels[0][slot] = []
+
+    def advance(self, now):
+        """Элементы, срок которых наступил к моменту now: (элемент, срок)."""
+        target = int((now - self.origin) // self.tick)
+        while self.current < target:
+            self.step()
+        expired = [(item, due) for _, due, item in self.ready]
+        self.ready = []
+        self.size -= len(expired)
+        return expired
@@ -0,0 +1,178 @@
+"""Постоянное хранилище состояния подписок в SQLite."""
+import hashlib
+import os
+import sqlite3
+import time
+
+STATE_DB = os.getenv('STATE_DB', 'state.sqlite3')
+STATE_BATCH_SIZE = int(os.getenv('STATE_BATCH_SIZE', 500))
+STATE_FLUSH_PERIOD = float(os.getenv('STATE_FLUSH_PERIOD', 5))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS subscription_state (
+    token_key TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    sent_message TEXT NOT NULL,
+    PRIMARY KEY (token_key, chat_id)
+);
+CREATE TABLE IF NOT EXISTS homework_status (
+    token_key TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    homework_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (token_key, chat_id, homework_id)
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    chat_id TEXT NOT NULL,
+    message_key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, message_key)
+);
+'''
+UPSERT_STATE = '''
+INSERT INTO subscription_state (token_key, chat_id, timestamp, sent_message)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (token_key, chat_id) DO UPDATE SET
+    timestamp = excluded.timestamp,
+    sent_message = excluded.sent_message
+'''
+UPSERT_STATUS = '''
+INSERT INTO homework_status (token_key, chat_id, homework_id, status)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (token_key, chat_id, homework_id) DO UPDATE SET
+    status = excluded.status
+'''
+UPSERT_MESSAGE = '''
+INSERT INTO outbox (chat_id, message_key, text, priority)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (chat_id, message_key) DO UPDATE SET
+    text = excluded.text,
+    priority = excluded.priority
+'''
+DELETE_MESSAGE = '''
+DELETE FROM outbox WHERE chat_id = ? AND message_key = ?
+'''
+SELECT_MESSAGES = '''
+SELECT chat_id, message_key, text, priority FROM outbox ORDER BY rowid
+'''
+SELECT_STATE = '''
+SELECT timestamp, sent_message FROM subscription_state
+WHERE token_key = ? AND chat_id = ?
+'''
+SELECT_STATUSES = '''
+SELECT homework_id, status FROM homework_status
+WHERE token_key = ? AND chat_id = ?
+'''
+
+
+def token_key(token):
+    """Идентификатор токена: в хранилище и логи сам токен не попадает."""
+    return hashlib.sha256(str(token).encode()).hexdigest()[:16]
+
+
+class StateStore:
+    """Состояние подписок и неотправленные сообщения Telegram.
+
+    Для подписки хранятся курсор, последнее сообщение и статусы работ.
+
+    Записи копятся в памяти и фиксируются одной транзакцией,
+    когда набирается batch_size записей или проходит flush_period секунд.
+    """
+
+    def __init__(
+            self, path=STATE_DB, batch_size=STATE_BATCH_SIZE,
+            flush_period=STATE_FLUSH_PERIOD
+    ):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self.flush_period = flush_period
+        self.pending = {}
+        self.pending_statuses = {}
+        self.pending_messages = {}
+        self.flushed_at = time.monotonic()
+
+    def load_state(self, key, chat_id):
+        """Сохранённые курсор и сообщение, либо начальное состояние."""
+        if (key, chat_id) in self.pending:
+            return self.pending[key, chat_id]
+        row = self.connection.execute(SELECT_STATE, (key, chat_id)).fetchone()
+        return tuple(row) if row else (0, '')
+
+    def load_statuses(self, key, chat_id):
+        """Доставленные статусы работ подписки: {id работы: статус}."""
+        self.flush()
+        return dict(self.connection.execute(SELECT_STATUSES, (key, chat_id)))
+
+    def save_state(self, key, chat_id, timestamp, sent_message):
+        """Запись состояния подписки в очередь на фиксацию."""
+        self.pending[key, chat_id] = (timestamp, sent_message)
+        self.maybe_flush()
+
+    def save_status(self, key, chat_id, homework_id, status):
+        """Запись доставленного статуса работы в очередь на фиксацию."""
+        self.pending_statuses[key, chat_id, homework_id] = status
+        self.maybe_flush()
+
+    def load_messages(self):
+        """Неотправленные сообщения (чат, ключ, текст, приоритет)."""
+        self.flush()
+        return [tuple(row) for row in self.connection.execute(
+            SELECT_MESSAGES
+        )]
+
+    def save_message(self, chat_id, key, text, priority=0):
+        """Запись сообщения, ожидающего отправки, в очередь на фиксацию."""
+        self.pending_messages[chat_id, key] = text, priority
+        self.maybe_flush()
+
+    def delete_message(self, chat_id, key):
+        """Удаление доставленного или отброшенного сообщения."""
+        self.pending_messages[chat_id, key] = None
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        """Фиксация, если набрался пакет или истёк период."""
+        if (
+            len(self.pending) + len(self.pending_statuses)
+            + len(self.pending_messages) >= self.batch_size
+            or time.monotonic() - self.flushed_at >= self.flush_period
+        ):
+            self.flush()
+
+    def flush(self):
+        """Фиксация накопленных записей одной транзакцией."""
+        if self.pending or self.pending_statuses or self.pending_messages:
+            with self.connection:
+                self.connection.executemany(UPSERT_STATE, [
+                    (key, chat_id, timestamp, sent_message)
+                    for (key, chat_id), (timestamp, sent_message)
+                    in self.pending.items()
+                ])
+                self.connection.executemany(UPSERT_STATUS, [
+                    (*owner, status)
+                    for owner, status in self.pending_statuses.items()
+                ])
+                self.connection.executemany(UPSERT_MESSAGE, [
+                    (*owner, *message)
+                    for owner, message in self.pending_messages.items()
+                    if message is not None
+                ])
+                self.connection.executemany(DELETE_MESSAGE, [
+                    owner for owner, message in self.pending_messages.items()
+                    if message is None
+                ])
+            self.pending.clear()
+            self.pending_statuses.clear()
+            self.pending_messages.clear()
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        """Фиксация остатка и закрытие базы."""
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,107 @@
+"""Реестр подписок: токены Практикума и чаты Telegram."""
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from decoding import Validators
+from digest import ErrorDigest
+from homework import (
+    MISSING_TOKENS_PHRASE, PRACTICUM_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_TOKEN,
+    check_tokens
+)
+from resilience import CircuitBreaker
+from storage import token_key
+from tracker import HomeworkIndex
+
+SUBSCRIPTIONS_FILE = os.getenv('SUBSCRIPTIONS_FILE')
+
+SUBSCRIPTIONS_LOADED_PHRASE = 'Загружено подписок: {count} из {path}.'
+BAD_SUBSCRIPTIONS_PHRASE = (
+    'Файл подписок {path} должен содержать список объектов '
+    'с ключами token, chat_ids и необязательным bot, '
+    'а получили: {error}.'
+)
+
+
+@dataclass
+class Subscription:
+    """Подписка чата на статусы домашних работ по токену Практикума."""
+
+    token: str = field(repr=False)
+    chat_id: str
+    bot: str = field(default='', repr=False)
+    timestamp: int = 0
+    sent_message: str = ''
+    status: str = ''
+    interval: float = 0
+    due: float = 0
+    breaker: CircuitBreaker = field(
+        default_factory=CircuitBreaker, repr=False
+    )
+    index: HomeworkIndex = field(default_factory=HomeworkIndex, repr=False)
+    errors: ErrorDigest = field(default_factory=ErrorDigest, repr=False)
+    validators: Optional[Validators] = field(default=None, repr=False)
+
+    @property
+    def headers(self):
+        """Заголовки запроса к API с токеном подписки."""
+        return {'Authorization': f'OAuth {self.token}'}
+
+    @property
+    def key(self):
+        """Идентификатор токена, безопасный для логов и хранилища."""
+        return token_key(self.token)
+
+
+def parse_subscriptions(entries):
+    """Разбор записей реестра вида {token, chat_ids, bot} в подписки.
+
+    bot — токен Telegram-бота, которого запустили эти чаты; без него
+    чаты обслуживает основной бот TELEGRAM_TOKEN.
+    """
+    if not isinstance(entries, list):
+        raise TypeError(type(entries))
+    subscriptions = []
+    for entry in entries:
+        token = entry['token']
+        chat_ids = entry.get('chat_ids') or [entry['chat_id']]
+        bot = entry.get('bot') or ''
+        if (
+            not token or not isinstance(chat_ids, list)
+            or not isinstance(bot, str)
+        ):
+            raise ValueError(entry)
+        subscriptions.extend(
+            Subscription(token, str(chat_id), bot) for chat_id in chat_ids
+        )
+    return subscriptions
+
+
+def load_subscriptions(path=SUBSCRIPTIONS_FILE):
+    """Загрузка реестра подписок при старте процесса.
+
+    Без файла подписок реестр состоит из одной подписки,
+    собранной из переменных окружения, как в homework.main.
+    """
+    if not path:
+        check_tokens()
+        return [Subscription(PRACTICUM_TOKEN, TELEGRAM_CHAT_ID)]
+    if not TELEGRAM_TOKEN:
+        message = MISSING_TOKENS_PHRASE.format(
+            missing_tokens=['TELEGRAM_TOKEN']
+        )
+        logging.critical(message)
+        raise KeyError(message)
+    try:
+        with open(path, encoding='utf-8') as file:
+            subscriptions = parse_subscriptions(json.load(file))
+    except (OSError, TypeError, KeyError, ValueError, AttributeError) as error:
+        message = BAD_SUBSCRIPTIONS_PHRASE.format(path=path, error=error)
+        logging.critical(message)
+        raise ValueError(message) from error
+    logging.info(
+        SUBSCRIPTIONS_LOADED_PHRASE.format(count=len(subscriptions), path=path)
+    )
+    return subscriptions
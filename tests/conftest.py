@@ -5,6 +5,8 @@ import pytest_timeout
 
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(root_dir)
+# состояние бота в тестах не должно попадать в файл state.sqlite3
+os.environ.setdefault('STATE_DB', ':memory:')
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
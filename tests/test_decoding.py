@@ -0,0 +1,127 @@
+import json
+import tracemalloc
+
+import pytest
+
+import decoding
+from decoding import (
+    body_validators, current_date, decode_response, parse_stream
+)
+from metrics import METRICS
+
+
+def byte_chunks(body, size):
+    return (body[start:start + size] for start in range(0, len(body), size))
+
+
+class StreamedResponse:
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return byte_chunks(self.body, chunk_size)
+
+    def close(self):
+        self.closed = True
+
+
+class BufferedResponse:
+    def __init__(self, body):
+        self.content = body
+
+
+class TestDecode:
+
+    @pytest.mark.parametrize('backend', ['json', 'orjson'])
+    def test_backends_agree(self, monkeypatch, backend):
+        monkeypatch.setattr(decoding, 'JSON_BACKEND', backend)
+        data = {'homeworks': [{'id': 1, 'homework_name': 'Проект'}],
+                'current_date': 1}
+        body = json.dumps(data, ensure_ascii=False).encode()
+        assert decode_response(BufferedResponse(body)) == data
+
+    def test_large_body_is_decoded_in_process_pool(self, monkeypatch):
+        monkeypatch.setattr(decoding, 'JSON_PROCESSES', 1)
+        monkeypatch.setattr(decoding, 'JSON_OFFLOAD_SIZE', 10)
+        monkeypatch.setattr(decoding, '_pool', None)
+        offloaded = METRICS.snapshot()['counters'].get('json.offloaded', 0)
+        try:
+            assert decode_response(BufferedResponse(b'[1, 2, 3, 4, 5]')) == [
+                1, 2, 3, 4, 5
+            ]
+            assert decode_response(BufferedResponse(b'[1]')) == [1]
+        finally:
+            decoding.pool().shutdown()
+        assert METRICS.snapshot()['counters']['json.offloaded'] == (
+            offloaded + 1
+        ), 'Убедитесь, что в пул процессов уходят только большие ответы.'
+
+
+class TestValidators:
+
+    def test_digest_ignores_current_date(self):
+        first = BufferedResponse(b'{"homeworks": [], "current_date": 1}')
+        second = BufferedResponse(b'{"homeworks": [], "current_date": 22}')
+        assert body_validators(first) == body_validators(second), (
+            'Убедитесь, что current_date не влияет на хеш тела ответа.'
+        )
+        assert current_date(second) == {'current_date': 22}
+        assert body_validators(BufferedResponse(
+            b'{"homeworks": [{"id": 1}], "current_date": 1}'
+        )) != body_validators(first)
+        assert body_validators(StreamedResponse(b'{}')) is None
+
+
+class TestStreamingDecode:
+
+    def test_stream_matches_full_decode(self):
+        data = {
+            'homeworks': [
+                {'id': 2, 'homework_name': 'Проект №2', 'status': 'approved',
+                 'date_updated': '2024-02-01T10:00:00Z'},
+                {'id': 1, 'homework_name': 'hw1', 'status': 'rejected'},
+            ],
+            'current_date': 1000198000,
+            'extra': [1.5, None, True],
+        }
+        body = json.dumps(data, ensure_ascii=False).encode()
+        assert parse_stream(byte_chunks(body, 1)) == data, (
+            'Убедитесь, что потоковый разбор даёт тот же результат, даже '
+            'если числа и символы UTF-8 разрезаны между кусками.'
+        )
+        assert parse_stream([b' { } ']) == {}
+
+    def test_only_newest_record_per_homework_is_kept(self):
+        body = json.dumps({'homeworks': [
+            {'id': 1, 'status': 'reviewing', 'date_updated': '2024-01-01'},
+            {'id': 2, 'status': 'approved', 'date_updated': '2024-01-02'},
+            {'id': 1, 'status': 'approved', 'date_updated': '2024-01-03'},
+        ], 'current_date': 1}).encode()
+        homeworks = parse_stream(byte_chunks(body, 7))['homeworks']
+        assert [(hw['id'], hw['status']) for hw in homeworks] == [
+            (1, 'approved'), (2, 'approved')
+        ]
+
+    def test_truncated_stream_is_an_error(self):
+        with pytest.raises(ValueError):
+            parse_stream(byte_chunks(b'{"homeworks": [{"id": 1}', 4))
+
+    def test_memory_does_not_grow_with_history(self):
+        record = {'id': 1, 'homework_name': 'hw', 'status': 'approved',
+                  'reviewer_comment': 'x' * 40}
+        body = (
+            b'{"homeworks": ['
+            + b','.join([json.dumps(record).encode()] * 20000)
+            + b'], "current_date": 1}'
+        )
+        response = StreamedResponse(body)
+        tracemalloc.start()
+        data = decode_response(response, stream=True)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert data['homeworks'] == [record] and response.closed
+        assert peak < len(body) / 4, (
+            'Убедитесь, что пиковая память разбора не зависит '
+            'от длины истории.'
+        )
@@ -0,0 +1,45 @@
+from digest import ErrorDigest, fingerprint
+from exceptions import ApiResponseError
+from tests.test_resilience import FakeClock
+
+
+def connection_error(url):
+    try:
+        try:
+            raise TimeoutError(url)
+        except TimeoutError:
+            raise ConnectionError(f'Сбой запроса к {url}')
+    except ConnectionError as error:
+        return error
+
+
+class TestErrorDigest:
+
+    def test_fingerprint_ignores_volatile_text(self):
+        assert fingerprint(connection_error('a?from_date=1')) == (
+            fingerprint(connection_error('a?from_date=2'))
+        ) == 'ConnectionError:TimeoutError', (
+            'Убедитесь, что отпечаток не зависит от текста ошибки.'
+        )
+        assert fingerprint(ApiResponseError('', status_code=500)) != (
+            fingerprint(ApiResponseError('', status_code=503))
+        )
+
+    def test_repeats_are_collapsed_into_summary(self):
+        clock = FakeClock()
+        errors = ErrorDigest(window=60, clock=clock)
+        assert errors.add(connection_error('1'), 'first') == 'first'
+        for text in ('second', 'third'):
+            clock.now += 10
+            assert errors.add(connection_error(text), text) is None, (
+                'Повторы ошибки в пределах окна не отправляются сразу.'
+            )
+        assert errors.summary() is None
+        clock.now = 60
+        summary = errors.summary()
+        assert 'third' in summary and '2 раз' in summary, (
+            'Убедитесь, что подавленные повторы попадают в сводку.'
+        )
+        assert errors.summary() is None
+        clock.now = 70
+        assert errors.add(connection_error('4'), 'fourth') == 'fourth'
@@ -0,0 +1,536 @@
+import asyncio
+import json
+import time
+from http import HTTPStatus
+
+from telebot.apihelper import ApiTelegramException
+
+import engine
+import homework
+import outbox
+import tests.check_utils as check_utils
+from heartbeat import WATCHDOG
+from outbox import Outbox
+from scheduler import TimingWheel
+from subscriptions import Subscription, parse_subscriptions
+from tests.test_resilience import FakeClock
+from tracker import HomeworkIndex
+
+
+def mock_http_get(data, http_status=HTTPStatus.OK):
+    def http_get(*args, **kwargs):
+        return check_utils.MockResponseGET(
+            *args, random_timestamp=1000198000,
+            http_status=http_status, data=data, **kwargs
+        )
+    return http_get
+
+
+class RecordingBot(check_utils.MockTelegramBot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = []
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        super().send_message(chat_id=chat_id, text=text, **kwargs)
+        self.sent.append((chat_id, text))
+
+
+def make_engine(http_get, bot=None):
+    bot = bot or RecordingBot()
+    outbox = Outbox(bot, chat_rate=1000)
+    return engine.PollingEngine(bot, http_get=http_get, outbox=outbox), bot
+
+
+def poll_cycles(poller, subscription, times=1):
+    async def cycles():
+        results = []
+        for _ in range(times):
+            results.append(await poller.poll_once(subscription))
+            await poller.outbox.drain()
+        return results
+    return asyncio.run(cycles())
+
+
+class TestEngine:
+
+    def test_poll_once_sends_verdict(self, data_with_new_hw_status):
+        poller, bot = make_engine(mock_http_get(data_with_new_hw_status))
+        subscription = Subscription('x', '1')
+        assert poll_cycles(poller, subscription, 2) == [True, False]
+        assert len(bot.sent) == 1, (
+            'Убедитесь, что движок отправляет вердикт в Telegram один раз.'
+        )
+        assert bot.chat_id == '1'
+        assert subscription.timestamp == (
+            data_with_new_hw_status['current_date'] - homework.CURSOR_OVERLAP
+        ), 'Курсор сдвигается, когда все изменения ответа доставлены.'
+
+    def test_cursor_advances_on_every_processed_response(self):
+        data = {'homeworks': [], 'current_date': 1000198000}
+        poller, _ = make_engine(mock_http_get(data))
+        subscription = Subscription('x', '1', timestamp=1000000000)
+        poll_cycles(poller, subscription)
+        assert subscription.timestamp == (
+            1000198000 - homework.CURSOR_OVERLAP
+        ), 'Убедитесь, что курсор сдвигается и по ответу без изменений.'
+        data['current_date'] = 1
+        poll_cycles(poller, subscription)
+        assert subscription.timestamp == 1000198000 - homework.CURSOR_OVERLAP
+
+    def test_cursor_waits_for_delivery(
+            self, monkeypatch, data_with_new_hw_status
+    ):
+        subscription = Subscription('x', '1')
+        cursors = []
+
+        class FlakyBot(RecordingBot):
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                cursors.append(subscription.timestamp)
+                if len(cursors) == 1:
+                    raise ConnectionError(text)
+                super().send_message(chat_id=chat_id, text=text, **kwargs)
+
+        monkeypatch.setattr(outbox, 'OUTBOX_RETRY_DELAY', 0.01)
+        poller, _ = make_engine(
+            mock_http_get(data_with_new_hw_status), FlakyBot()
+        )
+        poll_cycles(poller, subscription)
+        assert cursors == [0, 0], (
+            'Курсор не сдвигается, пока изменения ответа не доставлены.'
+        )
+        assert subscription.timestamp > 0
+
+    def test_dropped_message_settles_subscription(
+            self, data_with_new_hw_status
+    ):
+        class BlockedBot(RecordingBot):
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                self.sent.append((chat_id, text))
+                raise ApiTelegramException('sendMessage', None, {
+                    'error_code': 403,
+                    'description': 'Forbidden: bot was blocked by the user',
+                })
+
+        poller, bot = make_engine(
+            mock_http_get(data_with_new_hw_status), BlockedBot()
+        )
+        subscription = Subscription('x', '1')
+        poll_cycles(poller, subscription, 2)
+        assert len(bot.sent) == 1, (
+            'Убедитесь, что отброшенное сообщение не отправляется '
+            'повторно при каждом опросе.'
+        )
+        assert subscription.timestamp > 0
+        assert subscription.sent_message == ''
+        assert poller.store.load_statuses(subscription.key, '1')
+
+    def test_poll_once_sends_every_changed_homework(self):
+        data = {
+            'homeworks': [
+                {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+            ],
+            'current_date': 1000198000
+        }
+        poller, bot = make_engine(mock_http_get(data))
+        subscription = Subscription(
+            'x', '1', index=HomeworkIndex({'1': 'reviewing', '2': 'approved'})
+        )
+        poll_cycles(poller, subscription, 2)
+        texts = [text for _, text in bot.sent]
+        assert len(texts) == 1 and texts[0].index('hw1') < texts[0].index(
+            'hw2'
+        ), (
+            'Убедитесь, что неизменившиеся статусы не отправляются повторно.'
+        )
+
+    def test_first_poll_notifies_only_newest_homework(self):
+        data = {
+            'homeworks': [
+                {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+            ],
+            'current_date': 1000198000
+        }
+        poller, bot = make_engine(mock_http_get(data))
+        subscription = Subscription('x', '1')
+        poll_cycles(poller, subscription, 2)
+        texts = [text for _, text in bot.sent]
+        assert len(texts) == 1 and 'hw2' in texts[0] and 'hw1' not in (
+            texts[0]
+        ), (
+            'Убедитесь, что при пустом индексе отправляется только самая '
+            'свежая работа, а не вся история.'
+        )
+        assert poller.store.load_statuses(subscription.key, '1') == {
+            '1': 'approved', '2': 'reviewing'
+        }
+        assert subscription.timestamp > 0
+
+    def test_outage_opens_global_breaker_silently(self):
+        poller, bot = make_engine(
+            mock_http_get({}, HTTPStatus.INTERNAL_SERVER_ERROR)
+        )
+        subscription = Subscription('x', '1')
+        poll_cycles(poller, subscription, 3)
+        assert poller.breaker.state == 'open'
+        assert subscription.breaker.state == 'closed', (
+            'Сбой API не должен размыкать цепь отдельной подписки.'
+        )
+        assert not bot.sent and subscription.timestamp == 0
+        assert poller.deferral(subscription) == poller.breaker.retry_at
+
+    def test_bad_token_opens_subscription_breaker(self):
+        poller, bot = make_engine(
+            mock_http_get({}, HTTPStatus.UNAUTHORIZED)
+        )
+        subscription = Subscription('x', '1')
+        poll_cycles(poller, subscription, 2)
+        assert not bot.sent
+        poll_cycles(poller, subscription)
+        assert len(bot.sent) == 1, (
+            'Убедитесь, что о размыкании цепи подписки сообщается в чат.'
+        )
+        assert subscription.breaker.state == 'open'
+        assert poller.breaker.state == 'closed'
+
+    def test_error_message_does_not_leak_token(self):
+        poller, bot = make_engine(
+            mock_http_get({}, HTTPStatus.UNAUTHORIZED)
+        )
+        subscription = Subscription('SECRET-PRACTICUM-TOKEN', '1')
+        poll_cycles(poller, subscription, 3)
+        assert bot.sent and not any(
+            'SECRET-PRACTICUM-TOKEN' in text for _, text in bot.sent
+        ), 'Убедитесь, что токен Практикума не попадает в сообщения в чат.'
+
+    def test_rate_limit_defers_poll_without_failure(self):
+        class RateLimitedResponse(check_utils.MockResponseGET):
+            headers = {'Retry-After': '30'}
+
+        poller, bot = make_engine(
+            lambda **kwargs: RateLimitedResponse(
+                http_status=HTTPStatus.TOO_MANY_REQUESTS
+            )
+        )
+        subscription = Subscription('x', '1')
+        rate = poller.budget.rate
+        assert poll_cycles(poller, subscription) == [None], (
+            'Убедитесь, что при ответе 429 опрос откладывается.'
+        )
+        assert poller.budget.rate == rate / 2
+        assert poller.budget.updated >= poller.budget.clock() + 29
+        assert subscription.breaker.failures == 0
+        assert not bot.sent
+
+    def test_rate_limit_on_probe_reopens_breaker(self):
+        class RateLimitedResponse(check_utils.MockResponseGET):
+            headers = {'Retry-After': '30'}
+
+        statuses = [HTTPStatus.INTERNAL_SERVER_ERROR] * 3 + [
+            HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.OK
+        ]
+        poller, _ = make_engine(lambda **kwargs: RateLimitedResponse(
+            random_timestamp=1, http_status=statuses.pop(0)
+        ))
+        clock = FakeClock()
+        poller.breaker.clock = poller.budget.clock = clock
+        poller.budget.updated = 0.0
+        subscription = Subscription('x', '1')
+        poll_cycles(poller, subscription, 3)
+        assert poller.breaker.state == 'open'
+        clock.now = poller.breaker.retry_at
+        assert poller.deferral(subscription) is None
+        assert poll_cycles(poller, subscription) == [None]
+        assert poller.breaker.state == 'open', (
+            'Убедитесь, что ответ 429 на пробный запрос снова размыкает цепь, '
+            'а не оставляет её полуоткрытой.'
+        )
+        assert poller.deferral(subscription) >= clock.now + 30
+        clock.now = poller.breaker.retry_at
+        assert poller.deferral(subscription) is None
+        assert poll_cycles(poller, subscription) == [False]
+        assert poller.breaker.state == 'closed'
+
+    def test_open_subscription_breaker_keeps_global_breaker_open(self):
+        poller, _ = make_engine(mock_http_get({}))
+        subscription = Subscription('x', '1')
+        clock = FakeClock()
+        poller.breaker.clock = subscription.breaker.clock = clock
+        poller.breaker.trip()
+        subscription.breaker.trip()
+        subscription.breaker.retry_at = poller.breaker.retry_at + 10
+        clock.now = poller.breaker.retry_at
+        assert poller.deferral(subscription) == subscription.breaker.retry_at
+        assert poller.breaker.state == 'open', (
+            'Убедитесь, что отложенный опрос не оставляет общую цепь '
+            'полуоткрытой без пробного запроса.'
+        )
+        subscription.breaker.retry_at = clock.now
+        poller.breaker.retry_at = clock.now + 10
+        assert poller.deferral(subscription) == poller.breaker.retry_at
+        assert subscription.breaker.state == 'open'
+        clock.now = poller.breaker.retry_at
+        assert poller.deferral(subscription) is None
+
+    def test_request_has_timeouts(self):
+        calls = []
+
+        def http_get(**kwargs):
+            calls.append(kwargs)
+            return check_utils.MockResponseGET(random_timestamp=1)
+
+        poller, _ = make_engine(http_get)
+        poll_cycles(poller, Subscription('x', '1'))
+        assert calls[0]['timeout'] == (
+            engine.CONNECT_TIMEOUT, engine.READ_TIMEOUT
+        ), 'Убедитесь, что у запроса к API заданы таймауты.'
+        assert calls[0]['params'] == {'from_date': 0}
+
+    def test_deadline_cancels_stalled_poll(self, monkeypatch):
+        monkeypatch.setattr(engine, 'POLL_DEADLINE', 0.05)
+
+        def stalled_get(**kwargs):
+            time.sleep(0.3)
+            return check_utils.MockResponseGET(random_timestamp=1)
+
+        poller, bot = make_engine(stalled_get)
+        subscription = Subscription('x', '1')
+        assert asyncio.run(poller.poll_once(subscription)) is False, (
+            'Убедитесь, что зависший опрос прерывается по сроку.'
+        )
+        assert poller.breaker.failures == 1 and not bot.sent
+        assert engine.METRICS.snapshot()['counters']['deadline.missed'] >= 1
+
+    def test_rate_limit_pause_is_not_a_stall(self, data_with_new_hw_status):
+        busy = []
+
+        def http_get(**kwargs):
+            busy.append('poll_paused' in WATCHDOG.started)
+            return mock_http_get(data_with_new_hw_status)(**kwargs)
+
+        poller, _ = make_engine(http_get)
+        poller.budget.pause(0.1)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            poller.wheel = TimingWheel(loop.time())
+            poller.due_queue = asyncio.Queue()
+            worker = asyncio.ensure_future(poller.poll_worker('poll_paused'))
+            poller.due_queue.put_nowait([Subscription('x', '1')])
+            for _ in range(10):
+                await asyncio.sleep(0)
+            paused = 'poll_paused' in WATCHDOG.started
+            await asyncio.sleep(0.3)
+            worker.cancel()
+            return paused
+
+        assert asyncio.run(run()) is False, (
+            'Убедитесь, что ожидание лимита частоты API не выглядит '
+            'для сторожа зависшим опросом.'
+        )
+        assert busy == [True], (
+            'Убедитесь, что сторож следит за самим запросом к API.'
+        )
+        assert 'poll_paused' not in WATCHDOG.started
+
+    def test_full_outbox_does_not_miss_deadline(self, monkeypatch):
+        monkeypatch.setattr(engine, 'POLL_DEADLINE', 0.05)
+        data = {
+            'homeworks': [
+                {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+            ],
+            'current_date': 1000198000
+        }
+        bot = RecordingBot()
+        poller = engine.PollingEngine(
+            bot, http_get=mock_http_get(data), outbox=Outbox(bot, size=1)
+        )
+        missed = engine.METRICS.snapshot()['counters'].get(
+            'deadline.missed', 0
+        )
+
+        async def poll_into_full_outbox():
+            try:
+                await asyncio.wait_for(
+                    poller.process([Subscription(
+                        'x', '1', index=HomeworkIndex({'1': 'reviewing'})
+                    )]), 0.2
+                )
+            except asyncio.TimeoutError:
+                pass
+
+        asyncio.run(poll_into_full_outbox())
+        assert poller.breaker.failures == 0, (
+            'Убедитесь, что ожидание места в очереди Telegram не считается '
+            'сбоем API Практикума.'
+        )
+        assert engine.METRICS.snapshot()['counters'].get(
+            'deadline.missed', 0
+        ) == missed
+
+    def test_chats_of_one_token_share_a_request(self, data_with_new_hw_status):
+        calls = []
+
+        def http_get(**kwargs):
+            calls.append(kwargs['params'])
+            time.sleep(0.05)
+            return check_utils.MockResponseGET(
+                random_timestamp=1000198000, data=data_with_new_hw_status
+            )
+
+        poller, bot = make_engine(http_get)
+        personal, group = Subscription('x', '1'), Subscription('x', '2')
+        lagging = Subscription('x', '3', timestamp=-1)
+
+        async def poll_together():
+            await asyncio.gather(*(
+                poller.poll_once(subscription)
+                for subscription in (personal, group, lagging)
+            ))
+            await poller.outbox.drain()
+
+        asyncio.run(poll_together())
+        assert len(calls) == 2, (
+            'Убедитесь, что одновременные опросы одного токена делят запрос, '
+            'если их курсоры это позволяют.'
+        )
+        assert sorted(chat_id for chat_id, _ in bot.sent) == ['1', '2', '3']
+
+    def test_run_dispatches_due_subscriptions(self, monkeypatch):
+        monkeypatch.setattr(engine, 'WHEEL_TICK', 0.01)
+        monkeypatch.setattr(engine, 'poll_phase', lambda key: 0)
+        polled = []
+
+        async def poll_once(subscription, name='poll'):
+            polled.append(subscription.chat_id)
+            return False
+
+        poller = engine.PollingEngine(check_utils.MockTelegramBot(), workers=2)
+        monkeypatch.setattr(poller, 'poll_once', poll_once)
+
+        async def run_briefly():
+            task = asyncio.ensure_future(poller.run(
+                [Subscription('a', '1'), Subscription('b', '2')]
+            ))
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        asyncio.run(run_briefly())
+        assert sorted(polled) == ['1', '2'], (
+            'Убедитесь, что подписки из колеса таймеров попадают к '
+            'обработчикам и возвращаются в расписание.'
+        )
+
+    def test_chats_of_one_token_stay_aligned(self, monkeypatch):
+        monkeypatch.setattr(engine, 'WHEEL_TICK', 0.01)
+        monkeypatch.setattr(engine, 'poll_phase', lambda key: 0)
+        monkeypatch.setattr(
+            engine, 'next_interval', lambda status, interval, changed: 0.1
+        )
+        calls = []
+
+        def http_get(**kwargs):
+            calls.append(kwargs['params'])
+            return check_utils.MockResponseGET(
+                random_timestamp=1000198000 + len(calls)
+            )
+
+        poller, _ = make_engine(http_get)
+        shared = engine.METRICS.snapshot()['counters'].get(
+            'singleflight.shared', 0
+        )
+
+        async def run_briefly():
+            task = asyncio.ensure_future(poller.run([
+                Subscription('x', '1'), Subscription('x', '2'),
+                Subscription('x', '3'),
+            ]))
+            await asyncio.sleep(0.6)
+            task.cancel()
+
+        asyncio.run(run_briefly())
+        assert len(calls) >= 4
+        assert engine.METRICS.snapshot()['counters'][
+            'singleflight.shared'
+        ] - shared == 2 * len(calls), (
+            'Убедитесь, что чаты одного токена и после первого цикла '
+            'опрашиваются одним запросом к API.'
+        )
+
+    def test_throttled_poll_is_retried(self, monkeypatch):
+        monkeypatch.setattr(engine, 'WHEEL_TICK', 0.01)
+        monkeypatch.setattr(engine, 'poll_phase', lambda key: 0)
+        results = [None, False]
+        polled = []
+
+        async def poll_once(subscription, name='poll'):
+            polled.append(subscription.chat_id)
+            return results.pop(0) if results else False
+
+        poller = engine.PollingEngine(check_utils.MockTelegramBot(), workers=1)
+        monkeypatch.setattr(poller, 'poll_once', poll_once)
+
+        async def run_briefly():
+            task = asyncio.ensure_future(
+                poller.run([Subscription('a', '1')])
+            )
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        asyncio.run(run_briefly())
+        assert polled == ['1', '1'], (
+            'Убедитесь, что опрос, отложенный ответом 429, повторяется '
+            'после паузы лимита, а не через полный интервал.'
+        )
+
+    def test_unchanged_response_skips_processing(self, monkeypatch):
+        calls = []
+
+        class CachedResponse(check_utils.MockResponseGET):
+            headers = {'ETag': '"v1"'}
+
+            @property
+            def content(self):
+                return json.dumps(self.data).encode()
+
+            def json(self):
+                raise AssertionError('Тело не должно разбираться.')
+
+        def http_get(**kwargs):
+            calls.append(kwargs['headers'])
+            if len(calls) == 3:
+                return CachedResponse(http_status=HTTPStatus.NOT_MODIFIED)
+            return CachedResponse(random_timestamp=1000198000 + len(calls))
+
+        checked = []
+        monkeypatch.setattr(engine, 'check_response', lambda response: (
+            checked.append(response) or []
+        ))
+        poller, bot = make_engine(http_get)
+        subscription = Subscription('x', '1', timestamp=1000000000)
+        assert poll_cycles(poller, subscription, 3) == [False] * 3
+        assert len(checked) == 1, (
+            'Убедитесь, что ответ, совпавший с прошлым, не проверяется.'
+        )
+        assert 'If-None-Match' not in calls[0]
+        assert calls[1]['If-None-Match'] == '"v1"', (
+            'Убедитесь, что в запрос передаётся ETag прошлого ответа.'
+        )
+        assert subscription.timestamp == (
+            1000198002 - homework.CURSOR_OVERLAP
+        )
+        assert engine.METRICS.ratio('cache.hit', 'cache.miss') > 0
+
+    def test_parse_subscriptions_expands_chats(self):
+        subscriptions = parse_subscriptions([
+            {'token': 'a', 'chat_ids': [1, 2]},
+            {'token': 'b', 'chat_id': 3, 'bot': 'tg'},
+        ])
+        assert [(item.token, item.chat_id) for item in subscriptions] == [
+            ('a', '1'), ('a', '2'), ('b', '3')
+        ], 'Каждая пара токен-чат должна стать отдельной подпиской.'
+        assert [item.bot for item in subscriptions] == ['', '', 'tg']
+        assert subscriptions[0].headers == {'Authorization': 'OAuth a'}
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from heartbeat import Watchdog
+from metrics import METRICS
+from tests.test_resilience import FakeClock
+
+
+class TestWatchdog:
+
+    def test_time_since_last_beat_is_exposed(self):
+        clock = FakeClock()
+        watchdog = Watchdog(clock=clock)
+        watchdog.beat('poll')
+        clock.now = 42
+        watchdog.check()
+        assert METRICS.snapshot()['gauges']['watchdog.since_poll'] == 42, (
+            'Убедитесь, что время с последнего удачного опроса '
+            'попадает в метрики.'
+        )
+
+    def test_stalled_worker_is_restarted(self):
+        clock = FakeClock()
+        watchdog = Watchdog(stall=5, clock=clock)
+        starts = []
+
+        async def worker(name):
+            starts.append(name)
+            watchdog.busy(name)
+            if len(starts) == 1:
+                await asyncio.sleep(3600)
+            watchdog.idle(name)
+            return 'done'
+
+        async def run():
+            watchdog.loop = asyncio.get_running_loop()
+            supervised = asyncio.ensure_future(
+                watchdog.supervise('poll0', worker)
+            )
+            while not starts:
+                await asyncio.sleep(0)
+            clock.now = 10
+            watchdog.check()
+            return await supervised
+
+        assert asyncio.run(run()) == 'done'
+        assert starts == ['poll0', 'poll0'], (
+            'Убедитесь, что зависший обработчик перезапускается.'
+        )
+        assert 'watchdog.loop_lag' in METRICS.snapshot()['gauges']
+
+    def test_stalled_loop_is_reported_with_stack(self, caplog):
+        clock = FakeClock()
+        watchdog = Watchdog(stall=5, clock=clock)
+        watchdog.busy('main')
+        clock.now = 6
+        with caplog.at_level(logging.ERROR):
+            watchdog.check()
+        assert 'main' in caplog.text and 'test_heartbeat' in caplog.text, (
+            'Убедитесь, что для зависшего цикла в лог пишется его стек.'
+        )
+        watchdog.idle('main')
+        caplog.clear()
+        clock.now = 20
+        watchdog.check()
+        assert not caplog.text
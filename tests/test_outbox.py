@@ -0,0 +1,267 @@
+import asyncio
+import threading
+
+from telebot.apihelper import ApiTelegramException
+
+import outbox as outbox_module
+from heartbeat import WATCHDOG
+from outbox import LANE_ERROR, LANE_REVIEWING, Notification, Outbox
+from storage import StateStore
+from tests.test_engine import RecordingBot
+
+
+class FloodControlledBot(RecordingBot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attempts = 0
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        self.attempts += 1
+        if self.attempts == 1:
+            raise ApiTelegramException('sendMessage', None, {
+                'error_code': 429,
+                'description': 'Too Many Requests: retry after 0',
+                'parameters': {'retry_after': 0},
+            })
+        super().send_message(chat_id=chat_id, text=text, **kwargs)
+
+
+class FailingBot(RecordingBot):
+    def __init__(self, *args, failures=1, error=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+        self.error = error or ConnectionError('Telegram недоступен')
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        super().send_message(chat_id=chat_id, text=text, **kwargs)
+
+
+def send_all(outbox, notifications):
+    async def run():
+        for notification in notifications:
+            await outbox.put(notification)
+        await outbox.drain()
+    asyncio.run(run())
+
+
+class TestOutbox:
+
+    def test_chats_are_served_round_robin(self, monkeypatch):
+        monkeypatch.setattr(outbox_module, 'TELEGRAM_MAX_LENGTH', 2)
+        bot = RecordingBot()
+        outbox = Outbox(bot, workers=1, chat_rate=1000)
+        send_all(outbox, [
+            Notification('a', 'a1'), Notification('a', 'a2'),
+            Notification('b', 'b1'),
+        ])
+        assert bot.sent == [('a', 'a1'), ('b', 'b1'), ('a', 'a2')], (
+            'Убедитесь, что один чат не задерживает отправку в другие.'
+        )
+        assert outbox.depth == 0 and not outbox.pending
+
+    def test_pending_messages_are_coalesced(self):
+        bot = RecordingBot()
+        delivered = []
+        outbox = Outbox(bot, workers=1, chat_rate=1000)
+        send_all(outbox, [
+            Notification('a', 'hw1', key='1', on_delivered=delivered.append),
+            Notification('a', 'hw2', key='2', on_delivered=delivered.append),
+        ])
+        assert bot.sent == [('a', 'hw1\n\nhw2')], (
+            'Убедитесь, что накопленные сообщения чата уходят одним.'
+        )
+        assert delivered == ['hw1', 'hw2'] and outbox.depth == 0
+
+    def test_newer_status_supersedes_pending(self):
+        bot = RecordingBot()
+        outbox = Outbox(bot, workers=1, chat_rate=1000)
+        send_all(outbox, [
+            Notification('a', 'reviewing', key='1'),
+            Notification('a', 'other', key='2'),
+            Notification('a', 'approved', key='1'),
+        ])
+        assert bot.sent == [('a', 'approved\n\nother')], (
+            'Убедитесь, что устаревший статус работы не отправляется.'
+        )
+        assert outbox.depth == 0
+
+    def test_flood_control_is_retried(self):
+        bot = FloodControlledBot()
+        delivered = []
+        outbox = Outbox(bot, workers=1, chat_rate=1000)
+        send_all(outbox, [
+            Notification('a', 'verdict', on_delivered=delivered.append)
+        ])
+        assert bot.attempts == 2 and bot.sent == [('a', 'verdict')], (
+            'Убедитесь, что после ответа 429 сообщение отправляется повторно.'
+        )
+        assert delivered == ['verdict']
+
+    def test_duplicate_key_is_queued_once(self):
+        bot = RecordingBot()
+        outbox = Outbox(bot, workers=1, chat_rate=1000)
+        send_all(outbox, [
+            Notification('a', 'verdict', key='1'),
+            Notification('a', 'verdict', key='1'),
+        ])
+        assert bot.sent == [('a', 'verdict')]
+
+    def test_failed_delivery_is_retried(self, monkeypatch):
+        monkeypatch.setattr(outbox_module, 'OUTBOX_RETRY_DELAY', 0)
+        bot = FailingBot(failures=2)
+        delivered = []
+        store = StateStore()
+        outbox = Outbox(bot, workers=1, chat_rate=1000, store=store)
+        send_all(outbox, [
+            Notification('a', 'verdict', key='1',
+                         on_delivered=delivered.append)
+        ])
+        assert bot.sent == [('a', 'verdict')], (
+            'Убедитесь, что неудачная отправка повторяется с паузой.'
+        )
+        assert delivered == ['verdict'] and outbox.depth == 0
+        assert store.load_messages() == []
+
+    def test_permanent_error_is_not_retried(self):
+        bot = FailingBot(error=ApiTelegramException('sendMessage', None, {
+            'error_code': 403,
+            'description': 'Forbidden: bot was blocked by the user',
+        }))
+        store = StateStore()
+        outbox = Outbox(bot, workers=1, chat_rate=1000, store=store)
+        send_all(outbox, [Notification('a', 'verdict', key='1')])
+        assert not bot.sent and outbox.depth == 0
+        assert store.load_messages() == []
+
+    def test_newer_row_survives_delivery_of_older(self):
+        class SlowBot(RecordingBot):
+            started = threading.Event()
+            resume = threading.Event()
+
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                self.started.set()
+                self.resume.wait(1)
+                super().send_message(chat_id=chat_id, text=text, **kwargs)
+
+        store = StateStore()
+        bot = SlowBot()
+        outbox = Outbox(bot, workers=1, chat_rate=1000, store=store)
+        stored = []
+
+        async def run():
+            sender = asyncio.ensure_future(outbox.sender())
+            await outbox.put(Notification(
+                'a', 'reviewing', key='1',
+                on_delivered=lambda text: stored.extend(store.load_messages())
+            ))
+            while not bot.started.is_set():
+                await asyncio.sleep(0.01)
+            await outbox.put(Notification('a', 'approved', key='1'))
+            bot.resume.set()
+            await outbox.drain()
+            sender.cancel()
+
+        asyncio.run(run())
+        assert [row[2] for row in stored] == ['approved'], (
+            'Убедитесь, что доставка старого сообщения не удаляет из '
+            'хранилища более новое с тем же ключом.'
+        )
+        assert bot.sent == [('a', 'reviewing'), ('a', 'approved')]
+        assert store.load_messages() == []
+
+    def test_flood_pause_is_not_a_stall(self):
+        bot = RecordingBot()
+        outbox = Outbox(bot, workers=1, chat_rate=1000)
+        outbox.chat_bucket('a').pause(60)
+
+        async def run():
+            sender = asyncio.ensure_future(outbox.sender('send_paused'))
+            await outbox.put(Notification('a', 'verdict'))
+            for _ in range(10):
+                await asyncio.sleep(0)
+            waiting = 'a' in {chat_id for chat_id, _ in outbox.sending}
+            busy = 'send_paused' in WATCHDOG.started
+            sender.cancel()
+            return waiting, busy
+
+        assert asyncio.run(run()) == (True, False), (
+            'Убедитесь, что ожидание паузы флуд-контроля не выглядит '
+            'для сторожа зависшей отправкой.'
+        )
+        assert not bot.sent
+
+    def test_pending_messages_are_restored(self):
+        store = StateStore()
+        asyncio.run(Outbox(RecordingBot(), store=store).put(
+            Notification('a', 'verdict', key='1')
+        ))
+        bot = RecordingBot()
+        outbox = Outbox(bot, workers=1, chat_rate=1000, store=store)
+
+        async def restart():
+            await outbox.restore()
+            await outbox.drain()
+        asyncio.run(restart())
+        assert bot.sent == [('a', 'verdict')], (
+            'Убедитесь, что недоставленные сообщения отправляются '
+            'после перезапуска.'
+        )
+
+    def test_chats_are_sent_by_their_assigned_bot(self):
+        bots = [RecordingBot() for _ in range(3)]
+        for index, bot in enumerate(bots):
+            bot.token = f'bot{index}'
+        outbox = Outbox(bots, chat_rate=1000)
+        outbox.assign('b', 'bot2')
+        outbox.assign('c', '')
+        send_all(outbox, [Notification(chat, chat) for chat in 'abc'])
+        assert bots[2].sent == [('b', 'b')], (
+            'Убедитесь, что чат пишет закреплённый за ним бот.'
+        )
+        assert sorted(bots[0].sent) == [('a', 'a'), ('c', 'c')], (
+            'Чаты без назначенного бота обслуживает основной бот.'
+        )
+        assert not bots[1].sent
+
+    def test_verdicts_go_before_errors(self):
+        bot = RecordingBot()
+        outbox = Outbox(bot, workers=1, chat_rate=1000)
+        send_all(outbox, [
+            Notification('a', 'error', priority=LANE_ERROR),
+            Notification('b', 'error', priority=LANE_ERROR),
+            Notification('c', 'reviewing', priority=LANE_REVIEWING),
+            Notification('d', 'approved'),
+            Notification('b', 'rejected', key='1'),
+        ])
+        assert bot.sent == [
+            ('d', 'approved'), ('b', 'rejected\n\nerror'),
+            ('c', 'reviewing'), ('a', 'error'),
+        ], (
+            'Убедитесь, что вердикты отправляются раньше сообщений '
+            'о проверке, а те — раньше сообщений об ошибках.'
+        )
+
+    def test_lane_share_limits_errors(self):
+        bot = RecordingBot()
+        outbox = Outbox(
+            bot, workers=1, chat_rate=1000, lane_shares=(1, 1, 1e-6)
+        )
+
+        async def run():
+            sender = asyncio.ensure_future(outbox.sender())
+            for chat_id in ('a', 'b'):
+                await outbox.put(
+                    Notification(chat_id, 'error', priority=LANE_ERROR)
+                )
+            await asyncio.sleep(0.05)
+            await outbox.put(Notification('c', 'approved'))
+            await asyncio.sleep(0.05)
+            sender.cancel()
+        asyncio.run(run())
+        assert bot.sent == [('a', 'error'), ('c', 'approved')], (
+            'Убедитесь, что полоса ошибок не превышает свою долю лимита '
+            'и не задерживает вердикты.'
+        )
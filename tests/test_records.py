@@ -0,0 +1,49 @@
+import sys
+
+import pytest
+
+from homework import check_response, parse_status
+from records import Homework, HomeworkStatus
+from tracker import HomeworkIndex
+
+
+class TestHomework:
+
+    def test_record_is_compact_and_shares_statuses(self):
+        homeworks = check_response({'homeworks': [
+            {
+                'id': 1, 'homework_name': 'hw1', 'status': 'approved',
+                'reviewer_comment': 'Отлично!' * 100,
+                'date_updated': '2026-01-01T00:00:00Z',
+            },
+            {'id': 2, 'homework_name': 'hw2', 'status': ''.join('approved')},
+        ]})
+        first, second = homeworks
+        assert not hasattr(first, '__dict__'), (
+            'Убедитесь, что запись о работе не хранит словарь атрибутов.'
+        )
+        assert first.status is second.status is HomeworkStatus.APPROVED, (
+            'Убедитесь, что статусы записей — общие члены перечисления.'
+        )
+        assert sys.getsizeof(first) < sys.getsizeof(
+            {'id': 1, 'homework_name': 'hw1', 'status': 'approved'}
+        )
+
+    def test_index_interns_loaded_statuses(self):
+        first = HomeworkIndex({'1': ''.join('reviewing')})
+        second = HomeworkIndex({'1': ''.join('reviewing')})
+        assert first.statuses['1'] is second.statuses['1'], (
+            'Убедитесь, что статусы из хранилища не хранятся копиями.'
+        )
+
+    def test_validation_errors_are_kept(self):
+        with pytest.raises(TypeError):
+            check_response({'homeworks': ['hw1']})
+        with pytest.raises(KeyError):
+            parse_status(Homework.from_dict({'status': 'approved'}))
+        with pytest.raises(KeyError):
+            parse_status(Homework.from_dict({'homework_name': 'hw1'}))
+        with pytest.raises(ValueError):
+            parse_status(Homework.from_dict(
+                {'homework_name': 'hw1', 'status': 'unknown'}
+            ))
@@ -0,0 +1,105 @@
+from exceptions import ApiResponseError
+from homework import retry_after
+from resilience import CircuitBreaker, RateBudget, TokenBucket, is_outage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_threshold_and_backs_off(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(
+            threshold=3, base_delay=10, max_delay=100, clock=clock
+        )
+        assert not breaker.failure() and not breaker.failure()
+        assert breaker.failure(), 'Цепь должна разомкнуться на третьей ошибке.'
+        assert not breaker.allow()
+        assert 5 <= breaker.retry_at <= 10
+        clock.now = breaker.retry_at
+        assert breaker.allow() and breaker.state == 'half_open'
+        assert not breaker.allow(), 'Пробный запрос должен быть только один.'
+        assert not breaker.failure()
+        assert 10 <= breaker.retry_at - clock.now <= 20, (
+            'Пауза после неудачной пробы должна удваиваться.'
+        )
+        clock.now = breaker.retry_at
+        assert breaker.allow()
+        breaker.success()
+        assert breaker.state == 'closed' and breaker.allow()
+
+    def test_hold_reopens_probe_without_backoff(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, base_delay=10, clock=clock)
+        breaker.hold(30)
+        assert breaker.state == 'closed'
+        breaker.failure()
+        clock.now = breaker.retry_at
+        assert breaker.allow() and breaker.state == 'half_open'
+        breaker.hold(30)
+        assert breaker.state == 'open' and breaker.retry_at == clock.now + 30, (
+            'Убедитесь, что несостоявшийся пробный запрос снова размыкает '
+            'цепь до Retry-After.'
+        )
+        assert breaker.trips == 1 and breaker.failures == 1
+
+    def test_outage_classification(self):
+        assert is_outage(ConnectionError('timeout'))
+        assert is_outage(ApiResponseError('', status_code=503))
+        assert not is_outage(ApiResponseError('', status_code=401))
+        assert not is_outage(KeyError('homeworks'))
+
+
+class TestRateBudget:
+
+    def test_reservations_are_spaced_by_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        delays = [bucket.reserve() for _ in range(5)]
+        assert delays == [0.0, 0.0, 0.5, 1.0, 1.5], (
+            'Сверх запаса запросы должны идти с шагом 1 / rate.'
+        )
+
+    def test_wait_time_does_not_reserve(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=1, clock=clock)
+        assert bucket.wait_time() == 0.0
+        bucket.reserve()
+        assert bucket.wait_time() == bucket.wait_time() == 0.5
+        clock.now = 0.5
+        assert bucket.wait_time() == 0.0
+
+    def test_throttle_pauses_and_halves_rate(self):
+        clock = FakeClock()
+        budget = RateBudget(rate=4, capacity=1, min_rate=1, clock=clock)
+        assert budget.reserve() == 0.0
+        budget.throttle(retry_after=30)
+        assert budget.rate == 2
+        assert budget.reserve() == 30.5, (
+            'Убедитесь, что после 429 запросы ждут Retry-After.'
+        )
+        budget.throttle(retry_after=10)
+        assert budget.rate == 2, (
+            'Убедитесь, что пачка 429 в пределах одной паузы снижает '
+            'частоту один раз.'
+        )
+        clock.now = 31
+        budget.throttle(retry_after=None)
+        assert budget.rate == 1
+        for _ in range(1000):
+            budget.success()
+        assert budget.rate == 4
+
+    def test_retry_after_header(self):
+        assert retry_after({'Retry-After': '120'}) == 120.0
+        assert retry_after({}) is None
+        assert retry_after({'Retry-After': 'garbage'}) is None
+        assert retry_after(
+            {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        ) == 0.0
@@ -0,0 +1,83 @@
+import random
+
+from homework import RETRY_PERIOD
+from metrics import PhaseHistogram
+from scheduler import (
+    APPROVED_PERIOD, IDLE_BACKOFF, MAX_POLL_PERIOD, REVIEWING_PERIOD,
+    TimingWheel, jittered, next_interval, poll_phase
+)
+from storage import token_key
+
+
+class TestNextInterval:
+
+    def test_reviewing_is_polled_often(self):
+        assert next_interval('reviewing', MAX_POLL_PERIOD, False) == (
+            REVIEWING_PERIOD
+        )
+
+    def test_idle_subscription_backs_off_up_to_limit(self):
+        interval = next_interval('approved', 0, False)
+        assert interval == APPROVED_PERIOD
+        interval = next_interval('approved', interval, False)
+        assert interval == APPROVED_PERIOD * IDLE_BACKOFF
+        for _ in range(20):
+            interval = next_interval('approved', interval, False)
+        assert interval == MAX_POLL_PERIOD
+
+    def test_change_resets_interval(self):
+        assert next_interval('rejected', MAX_POLL_PERIOD, True) == (
+            RETRY_PERIOD
+        )
+        assert next_interval('', 0, False) == RETRY_PERIOD
+
+
+class TestTimingWheel:
+
+    def test_items_expire_on_their_tick_across_levels(self):
+        random.seed(7)
+        wheel = TimingWheel(origin=100.0, tick=1.0, slots=8, levels=4)
+        dues = {}
+        for item in range(500):
+            dues[item] = 100.0 + random.uniform(0, 3000)
+            wheel.schedule(item, dues[item])
+        assert wheel.size == 500
+        expired = {}
+        now = 100.0
+        while now < 3200:
+            now += random.choice((0.5, 1.0, 7.0))
+            for item, due in wheel.advance(now):
+                expired[item] = now
+                assert due == dues[item]
+                assert due <= now < due + 8, (
+                    'Элемент должен срабатывать не раньше срока и без '
+                    'задержки сверх шага продвижения колеса.'
+                )
+        assert len(expired) == 500 and wheel.size == 0
+
+    def test_overdue_item_is_ready_immediately(self):
+        wheel = TimingWheel(origin=0.0)
+        wheel.advance(10.0)
+        wheel.schedule('late', 3.0)
+        assert wheel.advance(10.0) == [('late', 3.0)]
+
+
+class TestPhaseSpreading:
+
+    def test_startup_phases_spread_evenly(self):
+        histogram = PhaseHistogram(RETRY_PERIOD, buckets=10)
+        for number in range(10000):
+            histogram.record(poll_phase(token_key(f'token{number}')))
+        rates = histogram.rates()
+        mean = sum(rates) / len(rates)
+        assert max(rates) < mean * 1.15, (
+            'Убедитесь, что первые опросы распределены по всему периоду, '
+            'а не приходятся на его начало.'
+        )
+        assert poll_phase(token_key('token1')) == (
+            poll_phase(token_key('token1'))
+        )
+
+    def test_jitter_stays_within_bounds(self):
+        for _ in range(1000):
+            assert 540 <= jittered(600, 0.1) <= 660
@@ -0,0 +1,48 @@
+from storage import StateStore, token_key
+
+
+class TestStateStore:
+
+    def test_state_survives_restart(self, tmp_path):
+        path = str(tmp_path / 'state.sqlite3')
+        store = StateStore(path, batch_size=10, flush_period=60)
+        store.save_state(token_key('token'), '1', 1000198000, 'verdict')
+        assert store.load_state(token_key('token'), '1') == (
+            1000198000, 'verdict'
+        )
+        store.close()
+
+        restarted = StateStore(path)
+        assert restarted.load_state(token_key('token'), '1') == (
+            1000198000, 'verdict'
+        ), 'Убедитесь, что курсор и последнее сообщение сохраняются в базе.'
+        assert restarted.load_state(token_key('other'), '1') == (0, '')
+        restarted.close()
+
+    def test_writes_are_batched(self, tmp_path):
+        store = StateStore(
+            str(tmp_path / 'state.sqlite3'), batch_size=3, flush_period=60
+        )
+        for chat_id in ('1', '2'):
+            store.save_state('key', chat_id, 1, '')
+        assert len(store.pending) == 2
+        store.save_state('key', '3', 1, '')
+        assert not store.pending, (
+            'Убедитесь, что накопленные записи фиксируются пакетом.'
+        )
+        store.close()
+
+    def test_outbox_messages_survive_restart(self, tmp_path):
+        path = str(tmp_path / 'state.sqlite3')
+        store = StateStore(path, batch_size=10, flush_period=60)
+        store.save_message('1', 'hw1', 'reviewing')
+        store.save_message('1', 'hw1', 'approved', 1)
+        store.save_message('2', 'hw2', 'rejected')
+        store.delete_message('2', 'hw2')
+        store.close()
+
+        restarted = StateStore(path)
+        assert restarted.load_messages() == [('1', 'hw1', 'approved', 1)], (
+            'Убедитесь, что неотправленные сообщения сохраняются в базе.'
+        )
+        restarted.close()
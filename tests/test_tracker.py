@@ -0,0 +1,41 @@
+from records import Homework
+from tracker import HomeworkIndex
+
+
+class TestHomeworkIndex:
+
+    def test_diff_returns_only_changed_oldest_first(self):
+        index = HomeworkIndex({'1': 'reviewing', '2': 'approved'})
+        homeworks = [Homework.from_dict(homework) for homework in [
+            {'id': 3, 'homework_name': 'hw3', 'status': 'reviewing'},
+            {'id': 2, 'homework_name': 'hw2', 'status': 'approved'},
+            {'id': 1, 'homework_name': 'hw1', 'status': 'rejected'},
+        ]]
+        changed = index.diff(homeworks)
+        assert [homework.key for homework in changed] == ['1', '3'], (
+            'Убедитесь, что в изменения попадают все работы со сменившимся '
+            'статусом, а не только первая.'
+        )
+        for homework in changed:
+            index.commit(homework)
+        assert index.diff(homeworks) == []
+
+    def test_homework_without_id_is_keyed_by_name(self):
+        index = HomeworkIndex()
+        homework = Homework.from_dict(
+            {'homework_name': 'hw123', 'status': 'approved'}
+        )
+        assert index.commit(homework) == 'hw123'
+        assert index.diff([homework]) == []
+
+    def test_seed_fills_empty_index_except_newest(self):
+        homeworks = [Homework.from_dict(homework) for homework in [
+            {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+            {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+        ]]
+        index = HomeworkIndex()
+        assert [homework.key for homework in index.seed(homeworks)] == ['1']
+        assert [homework.key for homework in index.diff(homeworks)] == ['2'], (
+            'Убедитесь, что при первом запуске бот не присылает всю историю.'
+        )
+        assert index.seed(homeworks) == []
@@ -0,0 +1,69 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from telebot import apihelper
+
+from metrics import METRICS
+from transport import PooledTransport, telegram_transport
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"homeworks": [], "current_date": 1}'
+        if 'getMe' in self.path:
+            body = b'{"ok": true, "result": {"id": 1, "is_bot": true}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JsonHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+    server.server_close()
+
+
+class TestTransport:
+
+    def test_keep_alive_reuses_connection(self, local_server):
+        transport = PooledTransport('test_keep_alive', pool_size=2)
+        for _ in range(5):
+            response = transport.get(url=local_server, params={})
+            assert response.json()['current_date'] == 1
+        transport.close()
+        stats = transport.stats()
+        assert stats['requests'] == 5
+        assert stats['handshakes'] == 1, (
+            'Убедитесь, что соединение переиспользуется между запросами.'
+        )
+        assert stats['reuse_ratio'] == 0.8
+
+    def test_telegram_requests_share_pool(self, local_server, monkeypatch):
+        monkeypatch.setattr(apihelper, 'CUSTOM_REQUEST_SENDER', None)
+        monkeypatch.setattr(apihelper, 'CONNECT_TIMEOUT', 15)
+        monkeypatch.setattr(apihelper, 'READ_TIMEOUT', 30)
+        monkeypatch.setattr(apihelper, 'API_URL', local_server + 'bot{0}/{1}')
+        transport = telegram_transport(pool_size=2, read_timeout=5)
+        for _ in range(5):
+            assert apihelper.get_me('123:token')['id'] == 1
+        transport.close()
+        assert apihelper.READ_TIMEOUT == 5
+        assert transport.stats()['handshakes'] == 1, (
+            'Убедитесь, что запросы к Bot API идут через общий пул.'
+        )
+        timings = METRICS.snapshot()['timings']
+        assert timings['telegram.server']['count'] >= 5, (
+            'Убедитесь, что время ответа сервера учитывается отдельно.'
+        )
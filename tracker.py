@@ -0,0 +1,51 @@
+"""Индекс статусов домашних работ и поиск изменений в ответе API."""
+import sys
+
+from records import intern_status
+
+
+class HomeworkIndex:
+    """Последние доставленные статусы работ одной подписки.
+
+    Ключи и статусы интернируются, поэтому подписки разных чатов
+    одного токена не хранят свои копии одних и тех же строк.
+    """
+
+    def __init__(self, statuses=None):
+        self.statuses = {
+            sys.intern(key): intern_status(status)
+            for key, status in dict(statuses or {}).items()
+        }
+
+    def seed(self, homeworks):
+        """Первое заполнение пустого индекса без уведомлений.
+
+        В пустом индексе (первый запуск, новое хранилище) все работы
+        истории выглядели бы изменившимися. Поэтому все, кроме самой
+        свежей (первой в ответе API), фиксируются как уже доставленные.
+        Возвращает их для записи в хранилище; непустой индекс не меняется.
+        """
+        if self.statuses:
+            return []
+        seeded = homeworks[1:]
+        for homework in seeded:
+            self.commit(homework)
+        return seeded
+
+    def diff(self, homeworks):
+        """Записи Homework с изменившимся статусом, от старых к новым.
+
+        Ответ просматривается за один проход, дальнейшая работа
+        (формирование и отправка сообщений) идёт только по изменениям.
+        """
+        changed = [
+            homework for homework in homeworks
+            if self.statuses.get(homework.key) != homework.status
+        ]
+        changed.reverse()
+        return changed
+
+    def commit(self, homework):
+        """Фиксация доставленного статуса, возвращает ключ работы."""
+        self.statuses[homework.key] = homework.status
+        return homework.key
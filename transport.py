@@ -0,0 +1,126 @@
+"""HTTP-транспорт с пулом keep-alive соединений."""
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+from metrics import METRICS
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 32))
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', 4))
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 8))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', 5))
+TELEGRAM_READ_TIMEOUT = float(os.getenv('TELEGRAM_READ_TIMEOUT', 15))
+
+
+def metered_pool(pool_cls, name):
+    """Пул соединений urllib3 с раздельным учётом времени.
+
+    {name}.connect — установка соединения (TCP и TLS), {name}.server —
+    ожидание ответа сервера после отправки запроса.
+    """
+    class MeteredConnection(pool_cls.ConnectionCls):
+        def connect(self):
+            start = time.monotonic()
+            super().connect()
+            METRICS.inc(f'{name}.handshakes')
+            METRICS.observe(f'{name}.connect', time.monotonic() - start)
+
+        def getresponse(self, *args, **kwargs):
+            start = time.monotonic()
+            try:
+                return super().getresponse(*args, **kwargs)
+            finally:
+                METRICS.observe(f'{name}.server', time.monotonic() - start)
+
+    class MeteredPool(pool_cls):
+        ConnectionCls = MeteredConnection
+
+    return MeteredPool
+
+
+class MeteredAdapter(HTTPAdapter):
+    """Адаптер requests с подсчётом TCP/TLS рукопожатий."""
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Подмена классов пулов на считающие соединения."""
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: metered_pool(pool_cls, self.name)
+            for scheme, pool_cls
+            in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class PooledTransport:
+    """Общая сессия requests с keep-alive и ограничением соединений.
+
+    pool_size — предел соединений на один хост: при его исчерпании
+    запрос ждёт освободившееся соединение, а не открывает новое.
+    """
+
+    def __init__(
+            self, name, pool_size=HTTP_POOL_SIZE, pool_hosts=HTTP_POOL_HOSTS
+    ):
+        self.name = name
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        adapter = MeteredAdapter(
+            name,
+            pool_connections=pool_hosts,
+            pool_maxsize=pool_size,
+            pool_block=True,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, **kwargs):
+        """GET-запрос через пул."""
+        return self.request('GET', **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Запрос через пул с учётом времени и числа запросов."""
+        start = time.monotonic()
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            METRICS.inc(f'{self.name}.requests')
+            METRICS.observe(f'{self.name}.request', time.monotonic() - start)
+
+    def stats(self):
+        """Число запросов, рукопожатий и доля переиспользованных соединений."""
+        counters = METRICS.snapshot()['counters']
+        sent = counters.get(f'{self.name}.requests', 0)
+        handshakes = counters.get(f'{self.name}.handshakes', 0)
+        return {
+            'requests': sent,
+            'handshakes': handshakes,
+            'reuse_ratio': round(1 - handshakes / sent, 4) if sent else 0.0,
+        }
+
+    def close(self):
+        """Закрытие всех соединений пула."""
+        self.session.close()
+
+
+def telegram_transport(
+        pool_size=TELEGRAM_POOL_SIZE, connect_timeout=TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=TELEGRAM_READ_TIMEOUT
+):
+    """Общий пул соединений для всех запросов pyTelegramBotAPI.
+
+    Библиотека отправляет запросы через CUSTOM_REQUEST_SENDER, поэтому
+    все боты процесса и все отправители делят pool_size keep-alive
+    соединений с Bot API вместо сессии на каждый поток.
+    """
+    transport = PooledTransport('telegram', pool_size=pool_size)
+    apihelper.CONNECT_TIMEOUT = connect_timeout
+    apihelper.READ_TIMEOUT = read_timeout
+    apihelper.CUSTOM_REQUEST_SENDER = transport.request
+    return transport